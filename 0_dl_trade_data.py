@@ -1,5 +1,5 @@
-"""This code imports the necessary modules for processing and saving trade data, specifically os, pickle,
-BinanceProcessor and config_main. The code also defines several functions for performing different tasks.
+"""This code imports the necessary modules for processing and saving trade data, specifically BinanceProcessor,
+save_dataset and config_main. The code also defines several functions for performing different tasks.
 
 main(): This function is the entry point of the script. It calls the print_config_variables() function to print the
 configuration variables, calls the process_data() function to process data, and then calls the save_data_to_disk()
@@ -13,12 +13,13 @@ The function passes in the configuration variables TICKER_LIST, trade_start_date
 and TECHNICAL_INDICATORS_LIST as arguments to the run() function. The function returns the result of the run()
 function, which is a tuple of four arrays: data_from_processor, price_array, tech_array, and time_array.
 
-save_data_to_disk(): This function creates a folder called data/trade_data/{TIMEFRAME}_{no_candles_for_train} if it
-doesn't exist. Then it saves the four arrays from the process_data() function to disk using the _save_to_disk()
-function.
+save_data_to_disk(): This function saves the four arrays from the process_data() function to the folder
+data/trade_data/{TIMEFRAME}_{trade_start_date}_{trade_end_date} with save_dataset() from function_dataset, as .npy
+files plus a JSON manifest that the backtest memory-maps.
 
-_save_to_disk(): This is a helper function that saves an array to disk using the pickle module. The function takes in
-two arguments, data and file_path, and saves the data to the specified file path.
+find_previous_data_folder(): This function looks for an earlier trade data folder of the same TIMEFRAME that starts
+at or before trade_start_date. If there is one, main() rolls it forward with BinanceProcessor.update() instead of
+downloading and recomputing the whole window.
 
 The code also includes an if __name__ == "__main__": block at the end, which calls the main() function when the
 script is run. This ensures that the script only runs when it is executed directly and not when it is imported as a
@@ -26,15 +27,20 @@ module."""
 
 
 import os
-import pickle
-
+import glob
 from processor_Binance import BinanceProcessor
+from function_dataset import save_dataset, load_dataset
 from config_main import TICKER_LIST, TECHNICAL_INDICATORS_LIST, TIMEFRAME, trade_start_date, trade_end_date, no_candles_for_train
 
 
 def main():
     print_config_variables()
-    data_from_processor, price_array, tech_array, time_array = process_data()
+    previous_folder = find_previous_data_folder()
+    if previous_folder is not None:
+        print('Updating from:             ', previous_folder)
+        data_from_processor, price_array, tech_array, time_array = refresh_data(previous_folder)
+    else:
+        data_from_processor, price_array, tech_array, time_array = process_data()
     save_data_to_disk(data_from_processor, price_array, tech_array, time_array)
 
 
@@ -52,19 +58,26 @@ def process_data():
                               if_vix=False)
 
 
-def save_data_to_disk(data_from_processor, price_array, tech_array, time_array):
-    data_folder = f'./data/trade_data/{TIMEFRAME}_{str(trade_start_date[2:10])}_{str(trade_end_date[2:10])}'
-    if not os.path.exists(data_folder):
-        os.mkdir(data_folder)
-    _save_to_disk(data_from_processor, f"{data_folder}/data_from_processor")
-    _save_to_disk(price_array, f"{data_folder}/price_array")
-    _save_to_disk(tech_array, f"{data_folder}/tech_array")
-    _save_to_disk(time_array, f"{data_folder}/time_array")
+def find_previous_data_folder():
+    # Folders are named {TIMEFRAME}_{yy-mm-dd start}_{yy-mm-dd end}, the dates sort as strings
+    candidates = []
+    for data_folder in glob.glob(f'./data/trade_data/{TIMEFRAME}_*_*'):
+        start, end = os.path.basename(data_folder)[len(TIMEFRAME) + 1:].split('_')
+        if start <= trade_start_date[2:10] and end > trade_start_date[2:10]:
+            candidates.append((end, data_folder))
+    return max(candidates)[1] if candidates else None
+
+
+def refresh_data(data_folder):
+    data_processor = BinanceProcessor()
+    data_from_processor, price_array, tech_array, time_array = load_dataset(data_folder, mmap_mode=None)
+    return data_processor.update(data_from_processor, price_array, tech_array, time_array, TICKER_LIST,
+                                 trade_start_date, trade_end_date, TIMEFRAME, TECHNICAL_INDICATORS_LIST, if_vix=False)
 
 
-def _save_to_disk(data, file_path):
-    with open(file_path, 'wb') as handle:
-        pickle.dump(data, handle, protocol=pickle.HIGHEST_PROTOCOL)
+def save_data_to_disk(data_from_processor, price_array, tech_array, time_array):
+    data_folder = f'./data/trade_data/{TIMEFRAME}_{str(trade_start_date[2:10])}_{str(trade_end_date[2:10])}'
+    save_dataset(data_folder, data_from_processor, price_array, tech_array, time_array)
 
 
 if __name__ == "__main__":
@@ -13,8 +13,9 @@ Attributes:
 Functions: main(): main function which runs the script. print_config_variables(): Print the current configuration
 variables process_data(): process data using the BinanceProcessor class and return the dataframe, price array,
 tech array and time array. save_data_to_disk(data_from_processor, price_array, tech_array, time_array): save the
-dataframe, price array, tech array and time array to the specified data folder. _save_to_disk(data, file_path): save
-the data to the specified file path
+dataframe, price array, tech array and time array to the specified data folder as .npy files with a JSON manifest
+(see function_dataset), so the optimize scripts can memory-map them. When the data folder already exists it is
+refreshed with BinanceProcessor.update(): only the new candles are downloaded and the window is rolled forward
 
 """
 
@@ -33,6 +34,7 @@ from config_main import (
     VAL_END_DATE
 )
 from processor_Binance import BinanceProcessor
+from function_dataset import save_dataset, load_dataset
 
 
 def print_config_variables():
@@ -79,22 +81,30 @@ def save_data(data_folder, data_from_processor, price_array, tech_array, time_ar
 
 def save_data_to_disk(data_from_processor, price_array, tech_array, time_array):
     data_folder = f'./data/{TIMEFRAME}_{no_candles_for_train + no_candles_for_val}'
-    if not os.path.exists(data_folder):
-        os.mkdir(data_folder)
-    _save_to_disk(data_from_processor, f"{data_folder}/data_from_processor")
-    _save_to_disk(price_array, f"{data_folder}/price_array")
-    _save_to_disk(tech_array, f"{data_folder}/tech_array")
-    _save_to_disk(time_array, f"{data_folder}/time_array")
+    save_dataset(data_folder, data_from_processor, price_array, tech_array, time_array)
 
 
-def _save_to_disk(data, file_path):
-    with open(file_path, 'wb') as handle:
-        pickle.dump(data, handle, protocol=pickle.HIGHEST_PROTOCOL)
+def refresh_data(data_folder):
+    # Roll the stored window forward, loaded into memory as its files are overwritten afterwards
+    DataProcessor = BinanceProcessor()
+    data_from_processor, price_array, tech_array, time_array = load_dataset(data_folder, mmap_mode=None)
+    return DataProcessor.update(data_from_processor, price_array, tech_array, time_array,
+                                TICKER_LIST,
+                                TRAIN_START_DATE,
+                                VAL_END_DATE,
+                                TIMEFRAME,
+                                TECHNICAL_INDICATORS_LIST,
+                                if_vix=False)
 
 
 def main():
     print_config_variables()
-    data_from_processor, price_array, tech_array, time_array = process_data()
+    data_folder = f'./data/{TIMEFRAME}_{no_candles_for_train + no_candles_for_val}'
+    # The folder name has no dates, update() checks the stored window and downloads everything if it does not fit
+    if os.path.isdir(data_folder):
+        data_from_processor, price_array, tech_array, time_array = refresh_data(data_folder)
+    else:
+        data_from_processor, price_array, tech_array, time_array = process_data()
     save_data_to_disk(data_from_processor, price_array, tech_array, time_array)
 
 
@@ -15,7 +15,7 @@ frame.
 
 The function 'save_best_agent' is used to save the best agent obtained from the trials. It copies the agent from the
 working directory and saves it in the results folder. It also pickles the trial information to avoid errors where
-params are not copied.
+params are not copied, and dumps the study to study.pkl (once more after the optimization).
 
 The function 'sample_hyperparams' is used for sampling the hyperparameters for the trials. It returns a dictionary of
 the hyperparameters.
@@ -38,7 +38,11 @@ import os
 import sys
 
 from distutils.dir_util import copy_tree
+from functools import partial
 from environment_Alpaca import CryptoEnvAlpaca
+from function_optuna import study_storage_url, optimize_parallel, study_lock, dump_study
+from function_dataset import dataset_reference, save_trial_artifacts
+from function_study_cache import study_cache
 from function_CPCV import *
 from function_train_test import *
 from config_main import *
@@ -93,23 +97,26 @@ def set_Pandas_Timedelta(TIMEFRAME):
 
 
 def save_best_agent(study, trial):
-    if study.best_trial.number != trial.number:
-        return
+    name_folder = trial.user_attrs['name_folder']
 
-    print('\n' + bcolors.OKGREEN + 'Found new best agent!' + bcolors.ENDC + '\n')
+    # Parallel workers can finish trials at the same time, only one of them checks and copies at once
+    with study_lock(f"./train_results/{name_folder}"):
+        if study.best_trial.number != trial.number:
+            return
 
-    # Copy agent from workdir and save in result folder
-    name_folder = trial.user_attrs['name_folder']
-    name_test = trial.user_attrs['name_test']
-    from_directory = f"./train_results/cwd_tests/{name_test}/"
-    to_directory = f"./train_results/{name_folder}/stored_agent/"
+        print('\n' + bcolors.OKGREEN + 'Found new best agent!' + bcolors.ENDC + '\n')
 
-    os.makedirs(to_directory, exist_ok=True)
-    copy_tree(from_directory, to_directory)
+        # Copy agent from workdir and save in result folder
+        from_directory = trial.user_attrs['cwd'] + '/'
+        to_directory = f"./train_results/{name_folder}/stored_agent/"
 
-    # Dump trial in pickle file to avoid error where params arre not copied
-    with open(f"./train_results/{name_folder}/best_trial", "wb") as handle:
-        pickle.dump(trial, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.makedirs(to_directory, exist_ok=True)
+        copy_tree(from_directory, to_directory)
+
+        # Dump trial in pickle file to avoid error where params arre not copied
+        with open(f"./train_results/{name_folder}/best_trial", "wb") as handle:
+            pickle.dump(trial, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        dump_study(study, f"./train_results/{name_folder}/study.pkl")
 
 
 def sample_hyperparams(trial):
@@ -133,13 +140,14 @@ def sample_hyperparams(trial):
         "norm_stocks": trial.suggest_categorical("norm_stocks", [2 ** -8]),
         "norm_tech": trial.suggest_categorical("norm_tech", [2 ** -15]),
         "norm_reward": trial.suggest_categorical("norm_reward", [2 ** -10]),
-        "norm_action": trial.suggest_categorical("norm_action", [10000])
+        "norm_action": trial.suggest_categorical("norm_action", [10000]),
+        "env_num": trial.suggest_categorical("env_num", [ENV_NUM])
     }
     return sampled_erl_params, sampled_env_params
 
 
 def set_pickle_attributes(trial, model_name, TIMEFRAME, TRAIN_START_DATE, TRAIN_END_DATE, VAL_START_DATE, VAL_END_DATE,
-                          TICKER_LIST, TECHNICAL_INDICATORS_LIST, name_folder, name_test, study):
+                          TICKER_LIST, TECHNICAL_INDICATORS_LIST, name_folder, name_test):
     # user attributes for saving in the pickle model file later
     trial.set_user_attr("model_name", model_name)
     trial.set_user_attr("timeframe", TIMEFRAME)
@@ -151,21 +159,21 @@ def set_pickle_attributes(trial, model_name, TIMEFRAME, TRAIN_START_DATE, TRAIN_
     trial.set_user_attr("technical_indicator_list", TECHNICAL_INDICATORS_LIST)
     trial.set_user_attr("name_folder", name_folder)
     trial.set_user_attr("name_test", name_test)
-    joblib.dump(study, f'train_results/{name_folder}/' + 'study.pkl')
 
 
-def load_saved_data(TIMEFRAME, no_candles_for_train):
+def load_saved_data(TIMEFRAME, no_candles_for_train, trial):
     data_folder = './data/' + TIMEFRAME + '_' + str(no_candles_for_train + no_candles_for_val)
     print('\nLOADING DATA FOLDER: ', data_folder, '\n')
-    with open(data_folder + '/data_from_processor', 'rb') as handle:
-        data_from_processor = pickle.load(handle)
-    with open(data_folder + '/price_array', 'rb') as handle:
-        price_array = pickle.load(handle)
-    with open(data_folder + '/tech_array', 'rb') as handle:
-        tech_array = pickle.load(handle)
-    with open(data_folder + '/time_array', 'rb') as handle:
-        time_array = pickle.load(handle)
-    return data_from_processor, price_array, tech_array, time_array
+    # The trial keeps a reference (path and content hash) to the dataset instead of a copy of it
+    trial.set_user_attr("dataset", dataset_reference(data_folder))
+    # Memory-mapped dataset, K-fold splits and HODL benchmarks, built by the first trial and shared by the later ones
+    return study_cache(data_folder, TIMEFRAME, build_KCV_splits)
+
+
+def build_KCV_splits(data_from_processor, price_array, tech_array, time_array):
+    # Independent of the hyperparameters, computed once per study
+    cv = KFold(n_splits=KCV_groups)
+    return list(cv.split(price_array)), {}
 
 
 def write_logs(name_folder, model_name, trial, cwd, erl_params, env_params):
@@ -185,18 +193,19 @@ def objective(trial, name_test, model_name, cwd, res_timestamp, gpu_id):
     name_folder = res_timestamp + '_' + name_test
 
     set_pickle_attributes(trial, model_name, TIMEFRAME, TRAIN_START_DATE, TRAIN_END_DATE, VAL_START_DATE, VAL_END_DATE,
-                          TICKER_LIST, TECHNICAL_INDICATORS_LIST, name_folder, name_test, study)
+                          TICKER_LIST, TECHNICAL_INDICATORS_LIST, name_folder, name_test)
+    trial.set_user_attr("cwd", cwd)
 
     # Sample set of hyperparameters
     erl_params, env_params = sample_hyperparams(trial)
 
-    # Load data from hard disk
-    data_from_processor, price_array, tech_array, time_array = load_saved_data(TIMEFRAME, no_candles_for_train)
+    # Load data and the K-fold splits of the study
+    cache = load_saved_data(TIMEFRAME, no_candles_for_train, trial)
+    data_from_processor, price_array, tech_array, time_array = cache.dataset
 
     # Set constants
     env = CryptoEnvAlpaca
     break_step = erl_params["break_step"]
-    cv = KFold(n_splits=KCV_groups)
 
     # initiate logs for tracking behaviour during training
     path_logs = write_logs(name_folder, model_name, trial, cwd, erl_params, env_params)
@@ -210,14 +219,15 @@ def objective(trial, name_test, model_name, cwd, res_timestamp, gpu_id):
     sharpe_list_ewq = []
     drl_rets_val_list = []
 
-    for split, (train_indices, test_indices) in enumerate(cv.split(price_array)):
+    for split, (train_indices, test_indices) in enumerate(cache.splits):
         with open(path_logs, 'a') as f:
             f.write('TIME START INNER: ' + str(datetime.now()))
             f.write('K-Fold:           ' + str(split))
 
         sharpe_bot, sharpe_eqw, drl_rets_tmp = train_and_test(trial, price_array, tech_array, train_indices,
                                                               test_indices, env, model_name, env_params,
-                                                              erl_params, break_step, cwd, gpu_id)
+                                                              erl_params, break_step, cwd, gpu_id,
+                                                              benchmark=cache.benchmarks[split])
 
         sharpe_list_ewq.append(sharpe_eqw)
         sharpe_list_bot.append(sharpe_bot)
@@ -230,17 +240,15 @@ def objective(trial, name_test, model_name, cwd, res_timestamp, gpu_id):
 
         # Fill the backtesting prediction matrix
         drl_rets_val_list.append(drl_rets_tmp)
-        trial.set_user_attr("price_array", price_array)
-        trial.set_user_attr("tech_array", tech_array)
-        trial.set_user_attr("time_array", time_array)
 
     # Hyperparameter objective function eval
     #######################################################################################################
     #######################################################################################################
 
-    # Matrices
-    trial.set_user_attr("drl_actions_matrix", drl_actions_matrix)
-    trial.set_user_attr("drl_rets_val_list", drl_rets_val_list)
+    # Matrices, stored next to the study instead of inside it
+    save_trial_artifacts(trial, f"./train_results/{name_folder}",
+                         drl_actions_matrix=drl_actions_matrix,
+                         drl_rets_val_list=drl_rets_val_list)
 
     # Interesting values
     trial.set_user_attr("sharpe_list_bot", sharpe_list_bot)
@@ -271,23 +279,36 @@ def optimize(name_test, model_name, gpu_id):
     with open(f"./train_results/{res_timestamp}_{name_test}/logs.txt", "w") as f:
         f.write(f"##################################  || {model_name} || ##################################")
 
-    global study
+    sampler = optuna.samplers.TPESampler(multivariate=True, seed=SEED_CFG)
+    pruner = optuna.pruners.HyperbandPruner(
+        min_resource=1,
+        max_resource=300,
+        reduction_factor=3
+    )
 
-    obj_with_argument = lambda trial: objective(trial, name_test, model_name, cwd, res_timestamp, gpu_id)
+    if STUDY_WORKERS > 1:
+        # Shared SQLite study, every worker gets its own cwd and sampler seed
+        storage = study_storage_url(path)
+        optuna.create_study(study_name=name_test, storage=storage, direction='maximize', sampler=sampler,
+                            pruner=pruner)
+        objectives = [partial(objective, name_test=name_test, model_name=model_name, cwd=f"{cwd}_worker_{worker_id}",
+                              res_timestamp=res_timestamp, gpu_id=gpu_id)
+                      for worker_id in range(STUDY_WORKERS)]
+        samplers = [optuna.samplers.TPESampler(multivariate=True, seed=SEED_CFG + worker_id)
+                    for worker_id in range(STUDY_WORKERS)]
+        study = optimize_parallel(name_test, storage, objectives, samplers, H_TRIALS, pruner,
+                                  callbacks=[save_best_agent], catch=(ValueError,))
+        dump_study(study, path + 'study.pkl')
+        return
 
-    # def obj_with_argument(trial):
-    #     return objective(trial, name_test, model_name, cwd, res_timestamp, gpu_id)
+    def obj_with_argument(trial):
+        return objective(trial, name_test, model_name, cwd, res_timestamp, gpu_id)
 
-    sampler = optuna.samplers.TPESampler(multivariate=True, seed=SEED_CFG)
     study = optuna.create_study(
         study_name=None,
         direction='maximize',
         sampler=sampler,
-        pruner=optuna.pruners.HyperbandPruner(
-            min_resource=1,
-            max_resource=300,
-            reduction_factor=3
-        )
+        pruner=pruner
     )
     study.optimize(
         obj_with_argument,
@@ -295,18 +316,21 @@ def optimize(name_test, model_name, gpu_id):
         catch=(ValueError,),
         callbacks=[save_best_agent]
     )
+    dump_study(study, path + 'study.pkl')
 
 
 # Main
 #######################################################################################
 
-gpu_id = 0
-name_model = 'ppo'
-name_test = 'model'
+# Guarded, the spawned optimization workers import this module
+if __name__ == '__main__':
+    gpu_id = 0
+    name_model = 'ppo'
+    name_test = 'model'
 
-print('\nStarting KCV optimization with:')
-print('drl algorithm:       ', name_model)
-print('name_test:           ', name_test)
-print('gpu_id:              ', gpu_id, '\n')
+    print('\nStarting KCV optimization with:')
+    print('drl algorithm:       ', name_model)
+    print('name_test:           ', name_test)
+    print('gpu_id:              ', gpu_id, '\n')
 
-optimize(name_test, name_model, gpu_id)
+    optimize(name_test, name_model, gpu_id)
@@ -6,6 +6,7 @@ some external functions."""
 import optuna
 import joblib
 from function_finance_metrics import *
+from function_dataset import load_trial_artifact
 import os
 import scipy.stats as stats
 
@@ -21,8 +22,8 @@ class StudyAnalyzer:
 
     def analyze(self):
         # get lists
-        self.sharpe_list_drl = self.best_trial.user_attrs['sharpe_list_bot']
-        self.sharpe_list_hodl = self.best_trial.user_attrs['sharpe_list_ewq']
+        self.sharpe_list_drl = load_trial_artifact(self.best_trial, 'sharpe_list_bot')
+        self.sharpe_list_hodl = load_trial_artifact(self.best_trial, 'sharpe_list_ewq')
 
         # Plot Optuna optimization
         fig = optuna.visualization.plot_optimization_history(self.study)
@@ -23,6 +23,7 @@ from config_main import *
 from function_finance_metrics import *
 from processor_Yahoo import Yahoofinance
 from environment_Alpaca import CryptoEnvAlpaca
+from function_dataset import load_dataset
 from drl_agents.elegantrl_models import DRLAgent as DRLAgent_erl
 
 
@@ -69,14 +70,7 @@ def download_CVIX(trade_start_date, trade_end_date):
 def load_and_process_data(TIMEFRAME, trade_start_date, trade_end_date):
     data_folder = f'./data/trade_data/{TIMEFRAME}_{str(trade_start_date[2:10])}_{str(trade_end_date[2:10])}'
     print(f'\nLOADING DATA FOLDER: {data_folder}\n')
-    with open(data_folder + '/data_from_processor', 'rb') as handle:
-        data_from_processor = pickle.load(handle)
-    with open(data_folder + '/price_array', 'rb') as handle:
-        price_array = pickle.load(handle)
-    with open(data_folder + '/tech_array', 'rb') as handle:
-        tech_array = pickle.load(handle)
-    with open(data_folder + '/time_array', 'rb') as handle:
-        time_array = pickle.load(handle)
+    data_from_processor, price_array, tech_array, time_array = load_dataset(data_folder)
 
     CVIX_df = download_CVIX(trade_start_date, trade_end_date)
     CVIX_df = pd.merge(time_array.to_series(), CVIX_df, left_index=True, right_index=True, how='left')
@@ -2,7 +2,8 @@ import joblib
 import seaborn as sns
 import math
 from function_finance_metrics import *
-from function_PBO import pbo
+from function_PBO import pbo, sharpe_statistics
+from function_dataset import load_trial_artifact
 from config_main import *
 
 
@@ -39,7 +40,7 @@ def load_validated_model(pickle_result):
     name_test = trials[0].user_attrs['name_test']
     timeframe = trials[0].user_attrs['timeframe']
     model_name = trials[0].user_attrs['model_name']
-    to_beat_sharpe = np.mean(trials[0].user_attrs['sharpe_list_ewq'])
+    to_beat_sharpe = np.mean(load_trial_artifact(trials[0], 'sharpe_list_ewq'))
     return best_trial_number, study, trials, model_name, number_of_trials, name_test, timeframe, to_beat_sharpe
 
 
@@ -47,7 +48,7 @@ def build_matrix_M_splits(trials, number_of_trials):
     matrix_cumrets_val = []
     for i in range(number_of_trials):
         trial = trials[i]
-        drl_rets_val_list = trial.user_attrs['drl_rets_val_list']
+        drl_rets_val_list = load_trial_artifact(trial, 'drl_rets_val_list')
         drl_rets_val_list= add_samples_equify_array_length(drl_rets_val_list)
         rets_single_trial = np.vstack(drl_rets_val_list)
         rets_single_trial = np.mean(rets_single_trial, axis=0)
@@ -59,7 +60,7 @@ def build_matrix_M_splits(trials, number_of_trials):
 def build_matrix_M_no_splits(trials, number_of_trials):
     matrix_cumrets_val = []
     for i in range(number_of_trials):
-        drl_rets_val_list_single = np.array(trials[i].user_attrs['drl_rets_val_list'])
+        drl_rets_val_list_single = np.array(load_trial_artifact(trials[i], 'drl_rets_val_list'))
         drl_rets = drl_rets_val_list_single[:-1] / drl_rets_val_list_single[1:] - 1
         drl_rets = np.mean(drl_rets, axis=0)
         matrix_cumrets_val.append(drl_rets)
@@ -74,7 +75,7 @@ pickle_results = [
                   "res_2023-01-23__17_07_49_model_KCV_ppo_5m_3H_20005k",
                   "res_2023-01-23__16_44_30_model_CPCV_ppo_5m_3H_20k"
                   ]
-S = 14
+S = 16
 
 # Execution
 #######################################################################################################
@@ -96,12 +97,18 @@ for count, result in enumerate(pickle_results):
     # else:
     M = build_matrix_M_splits(trials, number_of_trials)
 
+    # Screen all trials at once, deflated for the number of trials tried
+    sharpe_stats = sharpe_statistics(M, bench=0, log=False)
+    print('Trials with DSR > 0.95: ', np.sum(sharpe_stats.dsr > 0.95), '/', M.shape[1])
+
     pbox = pbo(M,
                S=S,
                metric_func=main_metric_pbo_analysis,
                name_exp=name_test,
                threshold=to_beat_sharpe, n_jobs=4,
-               plot=False, verbose=False, hist=False)
+               plot=False, verbose=False, hist=False,
+               stats_metric='sharpe_pct',
+               retain='summary')
     print('EWQ Sharpe to Beat: ', to_beat_sharpe)
 
     logits = pbox.logits
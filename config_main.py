@@ -10,6 +10,9 @@ The settings defined in this script include the random seed SEED_CFG, the time f
 the number of trials H_TRIALS,
 the number of groups used for testing K_TEST_GROUPS,
 the number of paths NUM_PATHS,
+the number of parallel training portfolios ENV_NUM,
+the number of processes training CV splits in parallel CV_WORKERS,
+the number of processes running Optuna trials in parallel STUDY_WORKERS,
 the number of K-fold cross validation groups KCV_groups
 the number of groups N_GROUPS,
 the number of splits NUMBER_OF_SPLITS,
@@ -52,6 +55,9 @@ KCV_groups = 5
 K_TEST_GROUPS = 2
 NUM_PATHS = 4
 N_GROUPS = NUM_PATHS + 1
+ENV_NUM = 1  # > 1 trains on CryptoVecEnvAlpaca with ENV_NUM portfolios stepped in lockstep
+CV_WORKERS = 1  # > 1 trains the CPCV splits of a trial in a pool of CV_WORKERS processes
+STUDY_WORKERS = 1  # > 1 runs the trials in STUDY_WORKERS processes on a shared SQLite study
 NUMBER_OF_SPLITS = nCr(N_GROUPS, N_GROUPS - K_TEST_GROUPS)
 
 print(NUMBER_OF_SPLITS)
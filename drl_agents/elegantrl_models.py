@@ -3,6 +3,8 @@ import torch
 import numpy as np
 from train.config import Arguments
 from train.run import train_and_evaluate, init_agent
+from environment_Alpaca import CryptoVecEnvAlpaca
+from function_trading import backtest_actor
 
 from drl_agents.agents import AgentDDPG, AgentPPO, AgentSAC, AgentTD3, AgentA2C
 
@@ -52,13 +54,24 @@ class DRLAgent:
         env = self.env(config=env_config,
                        env_params=self.env_params,
                        if_log=self.if_log)
-
         env.env_num = 1
+
+        # env_num > 1 explores with a vectorized env, the evaluator keeps stepping the single env
+        env_num = self.env_params.get("env_num", 1)
+        eval_env = env
+        if env_num > 1:
+            env = CryptoVecEnvAlpaca(config=env_config,
+                                     env_params=self.env_params,
+                                     if_log=self.if_log,
+                                     env_num=env_num,
+                                     gpu_id=gpu_id)
+
         agent = MODELS[model_name]
         if model_name not in MODELS:
             raise NotImplementedError("NotImplementedError")
 
         model = Arguments(agent=agent, env=env)
+        model.eval_env = eval_env
         model.learner_gpus = gpu_id
 
         if model_name in OFF_POLICY_MODELS:
@@ -72,7 +85,7 @@ class DRLAgent:
                 model.batch_size = model_kwargs["batch_size"]
                 model.gamma = model_kwargs["gamma"]
                 model.net_dim = model_kwargs["net_dimension"]
-                model.target_step = model_kwargs["target_step"]
+                model.target_step = max(1, int(model_kwargs["target_step"] // env_num))
                 model.eval_gap = model_kwargs["eval_time_gap"]
             except BaseException:
                 raise ValueError(
@@ -105,32 +118,8 @@ class DRLAgent:
             raise ValueError("Fail to load agent!")
 
         # test on the testing env
-        _torch = torch
-        state = environment.reset()
-        episode_returns = list()  # the cumulative_return / initial_account
-        episode_total_assets = list()
-        episode_total_assets.append(environment.initial_total_asset)
-
-        with _torch.no_grad():
-            for i in range(environment.max_step):
-                s_tensor = _torch.as_tensor((state,), device=device)
-                a_tensor = act(s_tensor)  # action_tanh = act.forward()
-                action = (
-                    a_tensor.detach().cpu().numpy()[0]
-                )  # not need detach(), because with torch.no_grad() outside
-                state, reward, done, _ = environment.step(action)
-
-                total_asset = (
-                        environment.cash
-                        + (
-                                environment.price_array[environment.time] * environment.stocks
-                        ).sum()
-                )
-                episode_total_assets.append(total_asset)
-                episode_return = total_asset / environment.initial_total_asset
-                episode_returns.append(episode_return)
-                if done:
-                    break
+        episode_total_assets = backtest_actor(act, environment, device)
+        episode_return = episode_total_assets[-1] / environment.initial_total_asset
         print("\n Test Finished!")
         print("episode_return: ", episode_return - 1, '\n')
         return episode_total_assets
@@ -3,18 +3,34 @@ trading platform. It is initialized with a configuration dictionary containing t
 arrays, and a dictionary of environment parameters such as the lookback period and normalization constants. The
 environment also has several class variables such as the initial capital, buy and sell costs, and the discount factor.
 
-The class has several methods such as reset(), step(), _generate_action_normalizer(),
-and _get_state() for interacting with the environment. The reset() method resets the environment to the initial state,
-the step() method takes in an action and returns the next state, reward, and done.
+The class has several methods such as reset(), step(), _generate_action_normalizer()
+and get_state() for interacting with the environment. The reset() method resets the environment to the initial state,
+the step() method takes in an action and returns the next state, reward, and done. The orders themselves are executed
+by trade_step() from function_trading.
 The _generate_action_normalizer() method generates the normalizer for the action,
-and the _get_state() method returns the current state of the environment.
+and the get_state() method returns the current state of the environment. The normalized float32 lookback windows of
+the tech array are precomputed once by the module level _generate_tech_window(), shared by both environments.
 
 The environment also has several class variables such as the initial capital, buy and sell costs, and the discount
-factor."""
+factor.
+
+The CryptoVecEnvAlpaca class applies trade_step to env_num portfolios at once on torch tensors, so the agents can
+collect experience through explore_vec_env."""
 
 import numpy as np
 import math
+import torch
 from config_main import ALPACA_LIMITS
+from function_trading import trade_step
+
+
+def _generate_tech_window(tech_array, norm_tech, lookback):
+    # Row k holds the normalized tech rows [k + lookback - 1, ..., k] of the lookback window ending at time
+    # k + lookback - 1, so get_state reads one contiguous row instead of stacking the lookback every step
+    tech_norm = np.ascontiguousarray(tech_array * norm_tech, dtype=np.float32)
+    windows = np.lib.stride_tricks.sliding_window_view(tech_norm, lookback, axis=0)
+    windows = windows[:, :, ::-1].transpose(0, 2, 1)
+    return np.array(windows).reshape(windows.shape[0], -1)
 
 
 class CryptoEnvAlpaca:  # custom env
@@ -49,6 +65,7 @@ class CryptoEnvAlpaca:  # custom env
         # Initialize constants
         self.tech_array = config['tech_array']
         self._generate_action_normalizer()
+        self.tech_window = _generate_tech_window(self.tech_array, self.norm_tech, self.lookback)
         self.crypto_num = self.price_array.shape[1]
         self.max_step = self.price_array.shape[0] - self.lookback - 1
 
@@ -85,6 +102,8 @@ class CryptoEnvAlpaca:  # custom env
         self.stocks = np.zeros(self.crypto_num, dtype=np.float32)
         self.stocks_cooldown = np.zeros_like(self.stocks)
         self.total_asset = self.cash + (self.stocks * self.price_array[self.time]).sum()
+        self.total_asset_eqw = np.sum(self.equal_weight_stock * self.price_array[self.time])
+        self.gamma_return = 0.0
 
         state = self.get_state()
         return state
@@ -92,66 +111,162 @@ class CryptoEnvAlpaca:  # custom env
     def step(self, actions) -> (np.ndarray, float, bool, None):
         self.time += 1
 
-        # if a stock is held add to its cooldown
-        for i in range(len(actions)):
-            if self.stocks[i] > 0:
-                self.stocks_cooldown[i] += 1
-
         price = self.price_array[self.time]
-        for i in range(self.action_dim):
-            norm_vector_i = self.action_norm_vector[i]
-            actions[i] = actions[i] * norm_vector_i
+        actions = actions * self.action_norm_vector
+
+        # Sell, force sell and buy in one pass of the trading engine
+        self.cash = trade_step(actions, price, self.stocks, self.stocks_cooldown, self.cash,
+                               self.minimum_qty_alpaca,
+                               buy_cost_pct=self.buy_cost_pct,
+                               sell_cost_pct=self.sell_cost_pct,
+                               safety_factor_stock_buy=self.safety_factor_stock_buy)
+
+        """update time"""
+        done = self.time == self.max_step
+        state = self.get_state()
+        next_total_asset = self.cash + (self.stocks * self.price_array[self.time]).sum()
+        next_total_asset_eqw = np.sum(self.equal_weight_stock * self.price_array[self.time])
+
+        # Difference in portfolio value + cooldown management
+        delta_bot = next_total_asset - self.total_asset
+        delta_eqw = next_total_asset_eqw - self.total_asset_eqw
+
+        # Reward function
+        reward = (delta_bot - delta_eqw) * self.norm_reward
+        self.total_asset = next_total_asset
+        self.total_asset_eqw = next_total_asset_eqw
+
+        self.gamma_return = self.gamma_return * self.gamma + reward
+        self.cumu_return = self.total_asset / self.initial_cash
+
+        if done:
+            reward = self.gamma_return
+            self.episode_return = self.total_asset / self.initial_cash
+        return state, reward, done, None
+
+    def get_state(self):
+        # A fresh array per call, the agents keep the returned states in their trajectories
+        state = np.empty(self.state_dim, dtype=np.float32)
+        state[0] = self.cash * self.norm_cash
+        state[1:1 + self.crypto_num] = self.stocks * self.norm_stocks
+        # the lookback window ending at the current bar
+        state[1 + self.crypto_num:] = self.tech_window[self.time - self.lookback + 1]
+        return state
+
+    def close(self):
+        pass
+
+    def _generate_action_normalizer(self):
+        action_norm_vector = []
+        price_0 = self.price_array[0]
+        for price in price_0:
+            x = math.floor(math.log(price, 10))  # the order of magnitude
+            action_norm_vector.append(1 / ((10) ** x))
+
+        action_norm_vector = np.asarray(action_norm_vector) * self.norm_action
+        self.action_norm_vector = np.asarray(action_norm_vector)
 
-        # Compute actions in dollars
-        actions_dollars = actions * price
 
-        # Sell
-        #######################################################################################################
-        #######################################################################################################
-        #######################################################################################################
+class CryptoVecEnvAlpaca:  # custom vectorized env
+    """Steps `env_num` independent portfolios over the same price/tech window in lockstep.
 
-        for index in np.where(actions < -self.minimum_qty_alpaca)[0]:
+    The orders are executed by the same trade_step as in CryptoEnvAlpaca, on torch tensors where every quantity
+    carries a leading `env_num` axis. States, rewards and dones are returned as
+    tensors on the agent device, which is what AgentBase.explore_vec_env and AgentPPO.explore_vec_env expect. All
+    portfolios share the same clock, so they finish together and are reset automatically. The minimum order
+    quantities are ALPACA_LIMITS, so the price array must hold the coins of config_main in that order.
+    """
 
-            if self.stocks[index] > 0:
+    def __init__(self, config, env_params, initial_capital=1000000,
+                 buy_cost_pct=0.003, sell_cost_pct=0.003, gamma=0.99, if_log=False, env_num=None, gpu_id=0):
 
-                if price[index] > 0:  # Sell only if current asset is > 0
-                    sell_num_shares = min(self.stocks[index], -actions[index])
+        self.if_log = if_log
+        self.env_params = env_params
+        self.env_num = env_params.get('env_num', 1) if env_num is None else env_num
+        self.device = torch.device(f"cuda:{gpu_id}" if (torch.cuda.is_available() and (gpu_id >= 0)) else "cpu")
+        self.lookback = env_params['lookback']
+        self.initial_total_asset = initial_capital
+        self.initial_cash = initial_capital
+        self.buy_cost_pct = buy_cost_pct
+        self.sell_cost_pct = sell_cost_pct
+        self.gamma = gamma
 
-                    assert sell_num_shares >= 0, "Negative sell!"
+        # read normalization of cash, stocks and tech
+        self.norm_cash = env_params['norm_cash']
+        self.norm_stocks = env_params['norm_stocks']
+        self.norm_tech = env_params['norm_tech']
+        self.norm_reward = env_params['norm_reward']
+        self.norm_action = env_params['norm_action']
 
-                    self.stocks_cooldown[index] = 0
-                    self.stocks[index] -= sell_num_shares
-                    self.cash += price[index] * sell_num_shares * (1 - self.sell_cost_pct)
+        # Initialize constants
+        self.price_array = config['price_array']
+        self.tech_array = config['tech_array']
+        self._generate_action_normalizer()
+        self.tech_window = _generate_tech_window(self.tech_array, self.norm_tech, self.lookback)
+        self.crypto_num = self.price_array.shape[1]
+        self.max_step = self.price_array.shape[0] - self.lookback - 1
+        if self.crypto_num != len(ALPACA_LIMITS):
+            raise ValueError(f'price_array has {self.crypto_num} coins, but ALPACA_LIMITS in config_main holds the '
+                             f'minimum order quantities of {len(ALPACA_LIMITS)} coins')
+
+        # Device copies of the data
+        self.price_ary = torch.as_tensor(self.price_array, dtype=torch.float64, device=self.device)
+        self.tech_window_ary = torch.as_tensor(self.tech_window, device=self.device)
+        self.action_norm_ary = torch.as_tensor(self.action_norm_vector, dtype=torch.float64, device=self.device)
+        self.minimum_qty_alpaca = ALPACA_LIMITS * 1.1  # 10 % safety factor
+        self.minimum_qty_ary = torch.as_tensor(self.minimum_qty_alpaca, dtype=torch.float64, device=self.device)
+        self.safety_factor_stock_buy = 1 - 0.1
+
+        self.equal_weight_stock = self.initial_cash / self.crypto_num / self.price_ary[0]
+
+        # reset
+        self.time = self.lookback - 1
+        self.cash = torch.full((self.env_num,), self.initial_cash, dtype=torch.float64, device=self.device)
+        self.stocks = torch.zeros((self.env_num, self.crypto_num), dtype=torch.float64, device=self.device)
+        self.stocks_cooldown = torch.zeros_like(self.stocks)
+        self.total_asset = self.cash + (self.stocks * self.price_ary[self.time]).sum(dim=1)
+        self.total_asset_eqw = (self.equal_weight_stock * self.price_ary[self.time]).sum()
+
+        self.episode_return = torch.zeros(self.env_num, dtype=torch.float64, device=self.device)
+        self.gamma_return = torch.zeros(self.env_num, dtype=torch.float64, device=self.device)
+
+        '''env information'''
+        self.env_name = 'MulticryptoVecEnv'
+
+        self.state_dim = 1 + self.crypto_num + self.tech_array.shape[1] * self.lookback
+        self.action_dim = self.crypto_num
+        self.if_discrete = False
+        self.target_return = 10**8
 
-        # FORCE 5% SELL every half day (30 min timeframe -> (24 * 2 / 2) * 30)
-        for index in np.where(self.stocks_cooldown >= 48)[0]:
-            sell_num_shares = self.stocks[index] * 0.05
-            self.stocks_cooldown[index] = 0
-            self.stocks[index] -= sell_num_shares
-            self.cash += price[index] * sell_num_shares * (1 - self.sell_cost_pct)
+    def reset(self) -> torch.Tensor:
+        self.time = self.lookback - 1
+        self.cash[:] = self.initial_cash
+        self.stocks[:] = 0
+        self.stocks_cooldown[:] = 0
+        self.total_asset = self.cash + (self.stocks * self.price_ary[self.time]).sum(dim=1)
+        self.total_asset_eqw = (self.equal_weight_stock * self.price_ary[self.time]).sum()
+        self.gamma_return[:] = 0
+
+        state = self.get_state()
+        return state
 
-        # Buy
-        #######################################################################################################
-        #######################################################################################################
-        #######################################################################################################
+    def step(self, actions) -> (torch.Tensor, torch.Tensor, torch.Tensor, None):
+        self.time += 1
 
-        for index in np.where(actions > self.minimum_qty_alpaca)[0]:
-            if price[index] > 0:  # Buy only if the price is > 0 (no missing data in this particular date)
+        price = self.price_ary[self.time]
+        actions = actions.to(device=self.device, dtype=torch.float64) * self.action_norm_ary
 
-                fee_corrected_asset = self.cash / (1 + self.buy_cost_pct)
-                max_stocks_can_buy = (fee_corrected_asset / price[index]) * self.safety_factor_stock_buy
-                buy_num_shares = min(max_stocks_can_buy, actions[index])
-                buy_num_shares_old = buy_num_shares
-                if buy_num_shares < self.minimum_qty_alpaca[index]:
-                    buy_num_shares = 0
-                self.stocks[index] += buy_num_shares
-                self.cash -= price[index] * buy_num_shares * (1 + self.buy_cost_pct)
+        # Sell, force sell and buy of all portfolios in one pass of the trading engine
+        self.cash = trade_step(actions, price, self.stocks, self.stocks_cooldown, self.cash,
+                               self.minimum_qty_ary,
+                               buy_cost_pct=self.buy_cost_pct,
+                               sell_cost_pct=self.sell_cost_pct,
+                               safety_factor_stock_buy=self.safety_factor_stock_buy)
 
         """update time"""
         done = self.time == self.max_step
-        state = self.get_state()
-        next_total_asset = self.cash + (self.stocks * self.price_array[self.time]).sum()
-        next_total_asset_eqw = np.sum(self.equal_weight_stock * self.price_array[self.time])
+        next_total_asset = self.cash + (self.stocks * price).sum(dim=1)
+        next_total_asset_eqw = (self.equal_weight_stock * price).sum()
 
         # Difference in portfolio value + cooldown management
         delta_bot = next_total_asset - self.total_asset
@@ -166,16 +281,20 @@ class CryptoEnvAlpaca:  # custom env
         self.cumu_return = self.total_asset / self.initial_cash
 
         if done:
-            reward = self.gamma_return
+            reward = self.gamma_return.clone()
             self.episode_return = self.total_asset / self.initial_cash
-        return state, reward, done, None
+            state = self.reset()
+        else:
+            state = self.get_state()
+
+        dones = torch.full((self.env_num,), done, dtype=torch.bool, device=self.device)
+        return state, reward.to(torch.float32), dones, None
 
     def get_state(self):
-        state = np.hstack((self.cash * self.norm_cash, self.stocks * self.norm_stocks))
-        for i in range(self.lookback):
-            tech_i = self.tech_array[-1 - i]
-            normalized_tech_i = tech_i * self.norm_tech
-            state = np.hstack((state, normalized_tech_i)).astype(np.float32)
+        state = torch.empty((self.env_num, self.state_dim), dtype=torch.float32, device=self.device)
+        state[:, 0] = self.cash * self.norm_cash
+        state[:, 1:1 + self.crypto_num] = self.stocks * self.norm_stocks
+        state[:, 1 + self.crypto_num:] = self.tech_window_ary[self.time - self.lookback + 1]
         return state
 
     def close(self):
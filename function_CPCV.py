@@ -64,6 +64,11 @@ class BaseTimeSeriesCrossValidator:
         self.eval_times = eval_times
         self.indices = np.arange(X.shape[0])
 
+        # Plain NumPy copies of the times, purge and embargo are computed on these with searchsorted
+        self.pred_values = _time_values(pred_times)
+        self.eval_values = _time_values(eval_times)
+        self.eval_sorted = bool(np.all(self.eval_values[1:] >= self.eval_values[:-1]))
+
 
 class CombPurgedKFoldCV(BaseTimeSeriesCrossValidator):
     """
@@ -128,14 +133,7 @@ class CombPurgedKFoldCV(BaseTimeSeriesCrossValidator):
         """
         super().split(X, y, pred_times, eval_times)
 
-        # Fold boundariesindices
-        fold_bounds = [(fold[0], fold[-1] + 1) for fold in np.array_split(self.indices, self.n_splits)]
-        # List of all combinations of n_test_splits folds selected to become test sets
-        selected_fold_bounds = list(itt.combinations(fold_bounds, self.n_test_splits))
-        # In order for the first round to have its whole test set at the end of the dataset
-        selected_fold_bounds.reverse()
-
-        for fold_bound_list in selected_fold_bounds:
+        for fold_bound_list in self.selected_fold_bounds():
             # Computes the bounds of the test set, and the corresponding indices
             test_fold_bounds, test_indices = self.compute_test_set(fold_bound_list)
             # Computes the train set indices
@@ -143,6 +141,69 @@ class CombPurgedKFoldCV(BaseTimeSeriesCrossValidator):
 
             yield train_indices, test_indices
 
+    def selected_fold_bounds(self) -> List[Tuple[Tuple[int, int], ...]]:
+        """
+        List the fold bounds of every combination of n_test_splits folds selected to become test sets, in split order.
+        """
+        # Fold boundaries indices
+        fold_edges = _array_split_edges(self.indices.shape[0], self.n_splits)
+        fold_bounds = [(int(start), int(end)) for start, end in zip(fold_edges[:-1], fold_edges[1:])]
+        # List of all combinations of n_test_splits folds selected to become test sets
+        selected_fold_bounds = list(itt.combinations(fold_bounds, self.n_test_splits))
+        # In order for the first round to have its whole test set at the end of the dataset
+        selected_fold_bounds.reverse()
+        return selected_fold_bounds
+
+    def split_intervals(self, X: pd.DataFrame, y: pd.Series = None, pred_times: pd.Series = None,
+                        eval_times: pd.Series = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Return all C(n_splits, n_test_splits) train/test splits at once as interval lists.
+        Every split is a tuple (train_intervals, test_intervals) of int arrays of shape (n_intervals, 2), each row a
+        half open range [start, end) of position indices, in the same order as split() yields them. With sorted
+        eval_times only the fold edges are touched, so the cost does not depend on the number of samples.
+        Parameters
+        ----------
+        Same as split().
+        Returns
+        -------
+        splits: List of tuples of np.ndarray
+            The train and test intervals of every split.
+        """
+        super().split(X, y, pred_times, eval_times)
+
+        splits = []
+        for fold_bound_list in self.selected_fold_bounds():
+            test_fold_bounds, test_indices = self.compute_test_set(fold_bound_list)
+            if self.eval_sorted:
+                train_intervals = self.compute_train_intervals(test_fold_bounds)
+            else:
+                train_mask = np.zeros(self.indices.shape[0], dtype=bool)
+                train_mask[self.compute_train_set(test_fold_bounds, test_indices)] = True
+                train_intervals = _mask_to_intervals(train_mask)
+            splits.append((train_intervals, np.array(test_fold_bounds, dtype=int).reshape(-1, 2)))
+        return splits
+
+    def split_bitmap(self, X: pd.DataFrame, y: pd.Series = None, pred_times: pd.Series = None,
+                     eval_times: pd.Series = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return all train/test splits at once as bit packed masks.
+        Parameters
+        ----------
+        Same as split().
+        Returns
+        -------
+        train_bits: np.ndarray, shape (n_combinations, ceil(n_samples / 8)), dtype uint8
+            Row i is np.packbits of the train mask of split i, np.unpackbits(train_bits, axis=1, count=n_samples)
+            recovers the boolean masks.
+        test_bits: np.ndarray, shape (n_combinations, ceil(n_samples / 8)), dtype uint8
+            Same for the test masks.
+        """
+        splits = self.split_intervals(X, y, pred_times, eval_times)
+        n_samples = self.indices.shape[0]
+        train_bits = _intervals_to_bitmap([train for train, _ in splits], n_samples)
+        test_bits = _intervals_to_bitmap([test for _, test in splits], n_samples)
+        return train_bits, test_bits
+
     def compute_train_set(self, test_fold_bounds: List[Tuple[int, int]], test_indices: np.ndarray) -> np.ndarray:
         """
         Compute the position indices of samples in the train set.
@@ -158,7 +219,9 @@ class CombPurgedKFoldCV(BaseTimeSeriesCrossValidator):
             A numpy array containing all the indices in the train set.
         """
         # As a first approximation, the train set is the complement of the test set
-        train_indices = np.setdiff1d(self.indices, test_indices)
+        train_mask = np.ones(self.indices.shape[0], dtype=bool)
+        train_mask[test_indices] = False
+        train_indices = self.indices[train_mask]
         # But we now have to purge and embargo
         for test_fold_start, test_fold_end in test_fold_bounds:
             # Purge
@@ -167,6 +230,41 @@ class CombPurgedKFoldCV(BaseTimeSeriesCrossValidator):
             train_indices = embargo(self, train_indices, test_indices, test_fold_end)
         return train_indices
 
+    def compute_train_intervals(self, test_fold_bounds: List[Tuple[int, int]]) -> np.ndarray:
+        """
+        Compute the train set as a list of intervals, by interval arithmetic on the fold edges. Requires sorted
+        eval_times, the result equals compute_train_set.
+        Parameters
+        ----------
+        test_fold_bounds : List of tuples of position indices
+            Each tuple records the bounds of a block of indices in the test set.
+        Returns
+        -------
+        train_intervals: np.ndarray, shape (n_intervals, 2)
+            Half open ranges [start, end) of position indices in the train set.
+        """
+        n_samples = self.indices.shape[0]
+        embargo_td = self.embargo_td.to_timedelta64()
+        # Every test block removes [first purged sample, end of the embargo) from the train set
+        removed = []
+        for test_fold_start, test_fold_end in test_fold_bounds:
+            purge_start = min(test_fold_start,
+                              np.searchsorted(self.eval_values, self.pred_values[test_fold_start], side='left'))
+            min_train_index = np.searchsorted(self.pred_values, self.eval_values[test_fold_end - 1] + embargo_td,
+                                              side='right')
+            removed_end = max(test_fold_end, min_train_index) if min_train_index < n_samples else test_fold_end
+            removed.append((int(purge_start), int(removed_end)))
+
+        train_intervals = []
+        position = 0
+        for removed_start, removed_end in sorted(removed):
+            if removed_start > position:
+                train_intervals.append((position, removed_start))
+            position = max(position, removed_end)
+        if position < n_samples:
+            train_intervals.append((position, n_samples))
+        return np.array(train_intervals, dtype=int).reshape(-1, 2)
+
     def compute_test_set(self, fold_bound_list: List[Tuple[int, int]]) -> Tuple[List[Tuple[int, int]], np.ndarray]:
         """
         Compute the indices of the samples in the test set.
@@ -181,7 +279,6 @@ class CombPurgedKFoldCV(BaseTimeSeriesCrossValidator):
         test_indices: np.ndarray
             A numpy array containing the test indices.
         """
-        test_indices = np.empty(0)
         test_fold_bounds = []
         for fold_start, fold_end in fold_bound_list:
             # Records the boundaries of the current test split
@@ -190,10 +287,42 @@ class CombPurgedKFoldCV(BaseTimeSeriesCrossValidator):
             # If the current test split is contiguous to the previous one, simply updates the endpoint
             elif fold_start == test_fold_bounds[-1][-1]:
                 test_fold_bounds[-1] = (test_fold_bounds[-1][0], fold_end)
-            test_indices = np.union1d(test_indices, self.indices[fold_start:fold_end]).astype(int)
+        test_indices = np.concatenate([self.indices[fold_start:fold_end] for fold_start, fold_end in test_fold_bounds])
         return test_fold_bounds, test_indices
 
 
+def _time_values(times: pd.Series) -> np.ndarray:
+    """NumPy values of a time series, timezone aware timestamps as naive UTC datetime64 so that searchsorted works."""
+    if isinstance(times.dtype, pd.DatetimeTZDtype):
+        times = times.dt.tz_convert('UTC').dt.tz_localize(None)
+    return times.to_numpy()
+
+
+def _array_split_edges(n_samples: int, n_splits: int) -> np.ndarray:
+    """Fold edges of np.array_split(np.arange(n_samples), n_splits), without materializing the folds."""
+    fold_sizes = np.full(n_splits, n_samples // n_splits)
+    fold_sizes[:n_samples % n_splits] += 1
+    return np.concatenate(([0], np.cumsum(fold_sizes)))
+
+
+def _mask_to_intervals(mask: np.ndarray) -> np.ndarray:
+    """Half open [start, end) ranges of the True runs of a boolean mask."""
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], mask, [False])).astype(np.int8)))
+    return edges.reshape(-1, 2)
+
+
+def _intervals_to_bitmap(intervals_list: List[np.ndarray], n_samples: int) -> np.ndarray:
+    """Bit packed masks, one row per interval list."""
+    bitmap = np.empty((len(intervals_list), (n_samples + 7) // 8), dtype=np.uint8)
+    mask = np.empty(n_samples, dtype=bool)
+    for row, intervals in enumerate(intervals_list):
+        mask[:] = False
+        for start, end in intervals:
+            mask[start:end] = True
+        bitmap[row] = np.packbits(mask)
+    return bitmap
+
+
 def compute_fold_bounds(cv: BaseTimeSeriesCrossValidator, split_by_time: bool) -> List[int]:
     """
     Compute a list containing the fold (left) boundaries.
@@ -225,7 +354,8 @@ def embargo(cv: BaseTimeSeriesCrossValidator, train_indices: np.ndarray,
     -------mestamps of p[t-1] values
   df0 = prices.inde---
     cv: Cross-validation class
-        Needs to have the attributes cv.pred_times, cv.eval_times, cv.embargo_dt and cv.indices.
+        Needs to have the attributes cv.pred_values, cv.eval_values, cv.eval_sorted, cv.embargo_td and cv.indices,
+        which are set by cv.split().
     train_indices: np.ndarray
         A numpy array containing all the indices of the samples currently included in the train set.
     test_indices : np.ndarray
@@ -240,11 +370,16 @@ def embargo(cv: BaseTimeSeriesCrossValidator, train_indices: np.ndarray,
     if not hasattr(cv, 'embargo_td'):
         raise ValueError("The passed cross-validation object should have a member cv.embargo_td defining the embargo"
                          "time.")
-    last_test_eval_time = cv.eval_times.iloc[test_indices[test_indices <= test_fold_end]].max()
-    min_train_index = len(cv.pred_times[cv.pred_times <= last_test_eval_time + cv.embargo_td])
+    # test_indices is sorted, the test samples up to test_fold_end are a prefix of it
+    last_test_position = np.searchsorted(test_indices, test_fold_end, side='right')
+    if cv.eval_sorted:
+        last_test_eval_time = cv.eval_values[test_indices[last_test_position - 1]]
+    else:
+        last_test_eval_time = cv.eval_values[test_indices[:last_test_position]].max()
+    min_train_index = np.searchsorted(cv.pred_values, last_test_eval_time + cv.embargo_td.to_timedelta64(),
+                                      side='right')
     if min_train_index < cv.indices.shape[0]:
-        allowed_indices = np.concatenate((cv.indices[:test_fold_end], cv.indices[min_train_index:]))
-        train_indices = np.intersect1d(train_indices, allowed_indices)
+        train_indices = train_indices[(train_indices < test_fold_end) | (train_indices >= min_train_index)]
     return train_indices
 
 
@@ -257,7 +392,8 @@ def purge(cv: BaseTimeSeriesCrossValidator, train_indices: np.ndarray,
     Parameters
     ----------combinatorial purged k fold
     cv: Cross-validation class
-        Needs to have the attributes cv.pred_times, cv.eval_times and cv.indices.
+        Needs to have the attributes cv.pred_values, cv.eval_values, cv.eval_sorted and cv.indices, which are set by
+        cv.split().
     train_indices: np.ndarray
         A numpy array containing all the indices of the samples currently included in the train set.
     test_fold_start : int
@@ -269,19 +405,23 @@ def purge(cv: BaseTimeSeriesCrossValidator, train_indices: np.ndarray,
     train_indices: np.ndarray
         A numpy array containing the train indices purged at test_fold_start.
     """
-    time_test_fold_start = cv.pred_times.iloc[test_fold_start]
+    time_test_fold_start = cv.pred_values[test_fold_start]
     # The train indices before the start of the test fold, purged.
-    train_indices_1 = np.intersect1d(train_indices, cv.indices[cv.eval_times < time_test_fold_start])
+    if cv.eval_sorted:
+        before_test = train_indices < np.searchsorted(cv.eval_values, time_test_fold_start, side='left')
+    else:
+        before_test = cv.eval_values[train_indices] < time_test_fold_start
     # The train indices after the end of the test fold.
-    train_indices_2 = np.intersect1d(train_indices, cv.indices[test_fold_end:])
-    return np.concatenate((train_indices_1, train_indices_2))
+    after_test = train_indices >= test_fold_end
+    return train_indices[before_test | after_test]
 
 
 def back_test_paths_generator(X, y, cv, t_span, n, k, prediction_times, evaluation_times, verbose=True):
+    # X, y, cv, prediction_times and evaluation_times are not needed to build the paths, kept for the call signature
+
     # split data into N groups, with N << T
-    # this will assign each index position to a group position
-    group_num = np.arange(t_span) // (t_span // n)
-    group_num[group_num == n] = n - 1
+    # this will assign each index position to a group position, the remainder t_span % n goes to the last group
+    group_num = np.minimum(np.arange(t_span) // (t_span // n), n - 1)
 
     # generate the combinations
     test_groups = np.array(list(itt.combinations(np.arange(n), k))).reshape(-1, k)
@@ -292,43 +432,40 @@ def back_test_paths_generator(X, y, cv, t_span, n, k, prediction_times, evaluati
         print('n_sim:', C_nk)
         print('n_paths:', n_paths)
 
-    # is_test is a T x C(n, k) array where each column is a logical array
-    # indicating which observation in in the test set
+    # is_test_group is a N x C(n, k) array where each column is a logical array indicating which groups are tested in
+    # that simulation, is_test is the same per observation (T x C(n, k))
     is_test_group = np.full((n, C_nk), fill_value=False)
-    is_test = np.full((t_span, C_nk), fill_value=False)
-
-    # assign test folds for each of the C(n, k) simulations
-    for k, pair in enumerate(test_groups):
-        i, j = pair
-        is_test_group[[i, j], k] = True
-
-        # assigning the test folds
-        mask = (group_num == i) | (group_num == j)
-        is_test[mask, k] = True
+    is_test_group[test_groups, np.arange(C_nk)[:, None]] = True
+    is_test = is_test_group[group_num]
 
     # for each path, connect the folds from different simulations to form a backtest path
     # the fold coordinates are: the fold number, and the simulation index e.g. simulation 0, fold 0 etc
-    path_folds = np.full((n, n_paths), fill_value=np.nan)
-
-    for i in range(n_paths):
-        for j in range(n):
-            s_idx = is_test_group[j, :].argmax().astype(int)
-            path_folds[j, i] = s_idx
-            is_test_group[j, s_idx] = False
-            cv.split(X, y, pred_times=prediction_times, eval_times=evaluation_times)
+    # every group is tested in exactly n_paths simulations, path p takes the p-th of them for every group
+    _, simulations = np.nonzero(is_test_group)
+    path_folds = simulations.reshape(n, n_paths).astype(float)
 
     # finally, for each path we indicate which simulation we're building the path from and the time indices
-    paths = np.full((t_span, n_paths), fill_value=np.nan)
-
-    for p in range(n_paths):
-        for i in range(n):
-            mask = (group_num == i)
-            paths[mask, p] = int(path_folds[i, p])
-    # paths = paths_# .astype(int)
+    paths = path_folds[group_num]
 
     return is_test, paths, path_folds
 
 
+def benchmark_back_test_paths(t_span=100_000, max_n=12, max_k=4, repeats=5):
+    """Time back_test_paths_generator for every N <= max_n and k <= max_k and print the best of `repeats` runs."""
+    import time
+
+    print(f"{'N':>3} {'k':>3} {'C(N,k)':>8} {'paths':>6} {'ms':>10}")
+    for n in range(3, max_n + 1):
+        for k in range(1, min(max_k, n - 1) + 1):
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                _, paths, path_folds = back_test_paths_generator(None, None, None, t_span, n, k, None, None,
+                                                                 verbose=False)
+                timings.append(time.perf_counter() - start)
+            print(f"{n:>3} {k:>3} {path_folds.max() + 1:>8.0f} {paths.shape[1]:>6} {min(timings) * 1000:>10.2f}")
+
+
 def plot_cv_indices(cv, X, y, group, ax, n_paths, k, paths, prediction_times,  evaluation_times, lw=5):
     """Create a sample plot for indices of a cross-validation object."""
 
@@ -400,3 +537,7 @@ def plot_cv_indices(cv, X, y, group, ax, n_paths, k, paths, prediction_times,  e
     #ax.xaxis.tick_top()
 
     return ax
+
+
+if __name__ == '__main__':
+    benchmark_back_test_paths()
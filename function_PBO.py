@@ -13,6 +13,8 @@ import pandas as pd
 import joblib as job
 import psutil as ps
 import os
+import shutil
+import tempfile
 
 from function_finance_metrics import *
 
@@ -39,6 +41,20 @@ PBO = cls.namedtuple(
     ],
 )
 
+SharpeStats = cls.namedtuple(
+    "SharpeStats",
+    [
+        "T",
+        "sharpe",
+        "skew",
+        "kurtosis",
+        "adjusted_sharpe",
+        "psr",
+        "dsr",
+        "min_trl",
+    ],
+)
+
 PBOCore = cls.namedtuple(
     "PBOCore",
     [
@@ -66,6 +82,9 @@ def pbo(
         verbose=False,
         plot=False,
         hist=False,
+        stats_metric=None,
+        retain="all",
+        spill_dir=None,
 ):
     """
     Based on http://papers.ssrn.com/sol3/papers.cfm?abstract_id=2326253
@@ -110,11 +129,31 @@ def pbo(
         used as prob. of OOS Loss calculation cutoff. For Sharpe ratio,
         this should be 0 to indicate probabilty of loss.
     n_jobs:
-        if greater than 1 then enable parallel mode
+        if greater than 1 then enable parallel mode, metric_func is evaluated
+        by joblib workers on memory mapped chunks, see
+        parallel_combination_metrics
     hist:
         Default False, whether to plot histogram for rank of logits.
         Some problems exist when S >= 10. Need to look at why numpy /
         matplotlib does it.
+    stats_metric:
+        Default None, evaluate metric_func on every IS/OOS matrix. 'sharpe_log'
+        or 'sharpe_pct' instead compute the IID Sharpe ratio of every
+        combination, equal to sharpe_iid(x, bench=0, factor=1, log=True / False)
+        on log / percentage returns, from per chunk sufficient statistics
+        (count, sum and sum of squares of the log excess returns). metric_func
+        is not used then and no J / J_bar matrices are built, which makes S=16
+        and more practical.
+    retain:
+        Default 'all', keep Cs, J, J_bar, R, R_rank and R_bar_rank of every
+        combination in the result. 'summary' streams the combinations, the IS
+        and OOS matrices are built one at a time and dropped after metric_func,
+        and only keeps rn, rn_bar, w_bar, logits, R_n_star, R_bar_n_star and
+        R_bar (the input of the non-optimized ECDF). The other fields are None.
+    spill_dir:
+        Default None. Directory to write R, R_bar, R_rank, R_bar_rank, rn and
+        logits of every combination to as .npy files, for diagnostics of a
+        'summary' run.
 
     Returns:
     PBO result in namedtuple, instance of PBO.
@@ -123,6 +162,10 @@ def pbo(
         raise ValueError(
             "S must be an even integer, {:.1f} was given".format(S)
         )
+    if retain not in ("all", "summary"):
+        raise ValueError(
+            "retain must be 'all' or 'summary', {} was given".format(retain)
+        )
 
     n_jobs = int(n_jobs)
     if n_jobs < 0:
@@ -148,28 +191,61 @@ def pbo(
     if verbose:
         print("Total sample size: {:,d}, chunck size: {:,d}".format(T, sub_T))
 
-    # generate subsets, each of length sub_T
-    Ms = []
-    Ms_values = []
-    for i in range(S):
-        start, end = i * sub_T, (i + 1) * sub_T
-        Ms.append((i, M[start:end, :]))
-        Ms_values.append(M[start:end, :])
-    Ms_values = np.array(Ms_values)
+    # generate subsets, each of length sub_T, as views of M
+    Ms_values = M.reshape(S, sub_T, N)
+    Ms = [(i, Ms_values[i]) for i in range(S)]
 
     if verbose:
         print("No. of Chuncks: {:,d}".format(len(Ms)))
 
-    # generate combinations
-    Cs = [x for x in itr.combinations(Ms, S // 2)]
+    # generate combinations, of chunk indices only when no J / J_bar are built
+    n_combinations = spec.comb(S, S // 2, exact=True)
+    if stats_metric is not None:
+        Cs = [x for x in itr.combinations(range(S), S // 2)]
+    elif retain == "summary":
+        # streamed in combination_metrics
+        Cs = None
+    else:
+        Cs = [x for x in itr.combinations(Ms, S // 2)]
     if verbose:
-        print("No. of combinations = {:,d}".format(len(Cs)))
+        print("No. of combinations = {:,d}".format(n_combinations))
 
     # Ms_index used to find J_bar (complementary OOS part)
     Ms_index = set([x for x in range(len(Ms))])
 
     # create J and J_bar
-    if n_jobs < 2:
+    if stats_metric is not None:
+        J = None
+        J_bar = None
+
+        # IS / OOS statistics of every combination are sums of the chunk statistics
+        is_chunk = np.zeros((len(Cs), S))
+        is_chunk[np.arange(len(Cs))[:, None], np.array(Cs)] = 1.0
+        count, total, total_sq, shift = chunk_sufficient_stats(Ms_values, stats_metric)
+        R = sharpe_from_stats(is_chunk @ count, is_chunk @ total, is_chunk @ total_sq, shift)
+        R_bar = sharpe_from_stats((1.0 - is_chunk) @ count, (1.0 - is_chunk) @ total, (1.0 - is_chunk) @ total_sq,
+                                  shift)
+
+        R_rank, R_bar_rank, rn, rn_bar, w_bar, logits = rank_logits(R, R_bar)
+
+    elif retain == "summary" or n_jobs >= 2:
+        if n_jobs < 2:
+            R, R_bar = combination_metrics(Ms_values, itr.combinations(range(S), S // 2), metric_func)
+        else:
+            # workers read the chunks from a memmap and get only ranges of combination numbers
+            R, R_bar = parallel_combination_metrics(Ms_values, metric_func, n_jobs)
+
+        if retain == "all":
+            # combinations of Ms keep the chunks in their original order
+            J = [np.concatenate([v for _, v in c]) for c in Cs]
+            J_bar = [np.concatenate(Ms_values[sorted(Ms_index - set(x for x, _ in c))]) for c in Cs]
+        else:
+            J = None
+            J_bar = None
+
+        R_rank, R_bar_rank, rn, rn_bar, w_bar, logits = rank_logits(R, R_bar)
+
+    elif n_jobs < 2:
         J = []
         J_bar = []
         for i in range(len(Cs)):
@@ -197,77 +273,14 @@ def pbo(
         # print(R)
         # print(R_bar)
 
-        # compute ranks of metrics
-        R_rank = [ss.rankdata(x) for x in R]
-        R_bar_rank = [ss.rankdata(x) for x in R_bar]
-
-        # print('----------  big  r (ranked) ---------')
-        # print(R_rank)
-        # print(R_bar_rank)
-
-        # find highest metric, rn contains the index position of max value
-        # in each set of R (IS)
-        rn = [np.argmax(r) for r in R_rank]
-
-        # print('-------------------- small r --------------------')
-        # print(rn)
-
-        # use above index to find R_bar (OOS) in same index position
-        # i.e. the same config / setting
-
-        rn_bar = [R_bar_rank[i][rn[i]] for i in range(len(R_bar_rank))]
-        #
-        # print(rn_bar)
-
-        # formula in paper used N+1 as the denominator for w_bar. For good reason
-        # to avoid 1.0 in w_bar which leads to inf in logits. Intuitively, just
-        # because all of the samples have outperformed one cannot be 100% sure.
-
-        w_bar = [float(r) / (N + 1) for r in rn_bar]
-
-        # logit(.5) gives 0 so if w_bar value is equal to median logits is 0
-        logits = [spec.logit(w) for w in w_bar]
-
-    else:
-        # use joblib for parallel calc
-        # print('Run in parallel mode.')
-        cores = job.Parallel(n_jobs=n_jobs)(
-            job.delayed(pbo_core_calc)(
-                Cs_x, Ms, Ms_values, Ms_index, metric_func, verbose
-            )
-            for Cs_x in Cs
-        )
-        # core_df = pd.DataFrame(cores, columns=PBOCore._fields)
-        # convert to values needed.
-        # # core_df = pd.DataFrame.from_records(cores)
-
-        # J = core_df.J.values
-        # J_bar = core_df.J_bar.values
-        # R = core_df.R.values
-        # R_bar = core_df.R_bar.values
-        # R_rank = core_df.R_rank.values
-        # R_bar_rank = core_df.R_bar_rank.values
-        # rn = core_df.rn.values
-        # rn_bar = core_df.rn_bar.values
-        # w_bar = core_df.w_bar.values
-        # logits = core_df.logits.values
-
-        J = [c.J for c in cores]
-        J_bar = [c.J_bar for c in cores]
-        R = [c.R for c in cores]
-        R_bar = [c.R_bar for c in cores]
-        R_rank = [c.R_rank for c in cores]
-        R_bar_rank = [c.R_bar_rank for c in cores]
-        rn = [c.rn for c in cores]
-        rn_bar = [c.rn_bar for c in cores]
-        w_bar = [c.w_bar for c in cores]
-        logits = [c.logits  for c in cores]
+        # ranks, best IS config, its OOS rank and the logits of all combinations in one pass
+        R_rank, R_bar_rank, rn, rn_bar, w_bar, logits = rank_logits(np.array(R), np.array(R_bar))
 
     ############ exited if / else ##########3
 
     # prob of overfitting
-    phi = np.array([1.0 if lam <= 0 else 0.0 for lam in logits]) / len(Cs)
-    pbo_test = np.sum(phi)
+    logits = np.asarray(logits)
+    pbo_test = np.sum(logits <= 0) / n_combinations
 
     # print("Test")
     # for i in range(len(R)):
@@ -278,13 +291,12 @@ def pbo(
     #     print(R[i][0][rn[i]])
     # print('test works')
 
-    R_n_star = np.array([R[i][rn[i]] for i in range(len(R))])
-    R_bar_n_star = np.array([R_bar[i][rn[i]] for i in range(len(R_bar))])
+    rn = np.asarray(rn)
+    R_n_star = np.asarray(R)[np.arange(len(rn)), rn]
+    R_bar_n_star = np.asarray(R_bar)[np.arange(len(rn)), rn]
     lm = ss.linregress(x=R_n_star, y=R_bar_n_star)
 
-    prob_oos_loss = np.sum(
-        [1.0 if r < threshold else 0.0 for r in R_bar_n_star]
-    ) / len(R_bar_n_star)
+    prob_oos_loss = np.sum(R_bar_n_star < threshold) / len(R_bar_n_star)
 
     # Stochastic dominance
     y = np.linspace(
@@ -304,6 +316,15 @@ def pbo(
     # backtest with low overfitting.
     dom_df["SD2"] = dom_df.non_optimized_OOS - dom_df.optimized_OOS
 
+    if spill_dir is not None:
+        os.makedirs(spill_dir, exist_ok=True)
+        for name, values in [("R", R), ("R_bar", R_bar), ("R_rank", R_rank), ("R_bar_rank", R_bar_rank),
+                             ("rn", rn), ("logits", logits)]:
+            np.save(os.path.join(spill_dir, name + ".npy"), np.asarray(values))
+
+    if retain == "summary":
+        Cs, J, J_bar, R, R_rank, R_bar_rank = None, None, None, None, None, None
+
     result = PBO(
         pbo_test,
         prob_oos_loss,
@@ -330,6 +351,160 @@ def pbo(
     return result
 
 
+def rank_logits(R, R_bar):
+    """
+    Ranks and logits of all combinations at once.
+
+    Parameters:
+        R:
+            IS metrics, array of shape (combinations, N)
+        R_bar:
+            OOS metrics, array of shape (combinations, N)
+
+    Returns:
+        R_rank, R_bar_rank, rn, rn_bar, w_bar, logits, one row / value per
+        combination, as in pbo_core_calc.
+    """
+    N = R.shape[1]
+    R_rank = ss.rankdata(R, axis=1)
+    R_bar_rank = ss.rankdata(R_bar, axis=1)
+
+    # find highest metric, rn contains the index position of max value
+    # in each set of R (IS), then the OOS rank of the same config / setting
+    rn = np.argmax(R_rank, axis=1)
+    rn_bar = R_bar_rank[np.arange(len(rn)), rn]
+
+    # formula in paper used N+1 as the denominator for w_bar. For good reason
+    # to avoid 1.0 in w_bar which leads to inf in logits. Intuitively, just
+    # because all of the samples have outperformed one cannot be 100% sure.
+    w_bar = rn_bar / (N + 1)
+
+    # logit(.5) gives 0 so if w_bar value is equal to median logits is 0
+    logits = spec.logit(w_bar)
+    return R_rank, R_bar_rank, rn, rn_bar, w_bar, logits
+
+
+def combination_metrics(Ms_values, combinations, metric_func):
+    """
+    IS and OOS metrics of the given combinations of chunk indices. The IS and
+    OOS matrices are built one combination at a time and not kept.
+
+    Parameters:
+        Ms_values:
+            chunks of the returns matrix, array of shape (S, sub_T, N)
+        combinations:
+            iterable of tuples of S / 2 chunk indices
+        metric_func:
+            evaluation function for returns data
+
+    Returns:
+        R, R_bar, arrays of shape (combinations, N)
+    """
+    S, _, N = Ms_values.shape
+    R = []
+    R_bar = []
+    is_chunk = np.zeros(S, dtype=bool)
+    for order in combinations:
+        is_chunk[:] = False
+        is_chunk[list(order)] = True
+        # boolean indexing keeps the chunks in their original order
+        R.append(metric_func(Ms_values[is_chunk].reshape(-1, N)))
+        R_bar.append(metric_func(Ms_values[~is_chunk].reshape(-1, N)))
+    return np.array(R).reshape(-1, N), np.array(R_bar).reshape(-1, N)
+
+
+def parallel_combination_metrics(Ms_values, metric_func, n_jobs, tasks_per_job=4):
+    """
+    combination_metrics over all combinations with joblib workers. Ms_values
+    is written once to a temporary .npy file that every worker memory maps,
+    each task only receives a range of combination numbers and returns the R
+    and R_bar rows of that range, which are concatenated in order.
+
+    Parameters:
+        Ms_values:
+            chunks of the returns matrix, array of shape (S, sub_T, N)
+        metric_func:
+            evaluation function for returns data
+        n_jobs:
+            number of worker processes
+        tasks_per_job:
+            ranges per worker, more ranges balance uneven metric_func run times
+
+    Returns:
+        R, R_bar, arrays of shape (combinations, N)
+    """
+    S = Ms_values.shape[0]
+    n_combinations = spec.comb(S, S // 2, exact=True)
+    bounds = np.linspace(0, n_combinations, min(n_combinations, n_jobs * tasks_per_job) + 1).astype(int)
+
+    tmp_dir = tempfile.mkdtemp(prefix="pbo_")
+    try:
+        values_path = os.path.join(tmp_dir, "Ms_values.npy")
+        np.save(values_path, Ms_values)
+        results = job.Parallel(n_jobs=n_jobs)(
+            job.delayed(_combination_metrics_range)(values_path, start, stop, metric_func)
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        )
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    R = np.concatenate([r for r, _ in results])
+    R_bar = np.concatenate([r_bar for _, r_bar in results])
+    return R, R_bar
+
+
+def _combination_metrics_range(values_path, start, stop, metric_func):
+    Ms_values = np.load(values_path, mmap_mode="r")
+    S = Ms_values.shape[0]
+    combinations = itr.islice(itr.combinations(range(S), S // 2), start, stop)
+    return combination_metrics(Ms_values, combinations, metric_func)
+
+
+def chunk_sufficient_stats(Ms_values, stats_metric):
+    """
+    Count, sum and sum of squares of the log excess returns (bench=0) of every
+    chunk and strategy, the inputs of sharpe_from_stats.
+
+    Parameters:
+        Ms_values:
+            chunks of the returns matrix, array of shape (S, sub_T, N)
+        stats_metric:
+            'sharpe_log' for log returns, 'sharpe_pct' for percentage returns
+
+    Returns:
+        count, total, total_sq of shape (S, N) and shift of shape (N,). The
+        returns are shifted by the per strategy mean `shift` before summing,
+        which keeps the sum of squares from cancelling.
+    """
+    if stats_metric == "sharpe_log":
+        excess = log_excess(Ms_values, 0)
+    elif stats_metric == "sharpe_pct":
+        excess = pct_to_log_excess(Ms_values, 0)
+    else:
+        raise ValueError(
+            "stats_metric must be 'sharpe_log' or 'sharpe_pct', {} was given".format(stats_metric)
+        )
+
+    valid = ~np.isnan(excess)
+    shift = np.nanmean(excess, axis=(0, 1))
+    centered = np.where(valid, excess - shift, 0.0)
+    count = valid.sum(axis=1).astype(float)
+    total = centered.sum(axis=1)
+    total_sq = np.einsum("stn,stn->sn", centered, centered)
+    return count, total, total_sq, shift
+
+
+def sharpe_from_stats(count, total, total_sq, shift):
+    """
+    IID Sharpe ratio (factor=1) from the sufficient statistics of
+    chunk_sufficient_stats, summed over the chunks of a combination. Works on
+    any number of leading dimensions, e.g. (combinations, N).
+    """
+    mean_centered = total / count
+    std = np.sqrt((total_sq - total * mean_centered) / (count - 1))
+    return (shift + mean_centered) / std
+
+
 def pbo_core_calc(Cs, Ms, Ms_values, Ms_index, metric_func, verbose=False):
     # make sure chucks are concatenated in their original order
     order = [x for x, _ in Cs]
@@ -606,6 +781,115 @@ def minTRL(sharpe, skew, kurtosis, target_sharpe=0, prob=0.95):
     return min_track
 
 
+def sharpe_statistics(M, bench=0, log=True, target_sharpe=0, prob=0.95, chunk_size=None):
+    """
+    PSR, DSR, MinTRL and adjusted Sharpe ratio of all N strategies of a T x N
+    returns matrix in one call, e.g. the matrix M of build_matrix_M_splits.
+
+    The matrix is read once in chunks of chunk_size rows (all rows if None),
+    every chunk and its float64 log excess returns are reduced to nan aware
+    power sums per strategy, so float32 and memory mapped input work without
+    a float64 copy of M. As in psr_from_returns and sharpe_iid_adjusted the
+    Sharpe ratio is computed on the log excess returns and skew and kurtosis
+    on the returns as given, the two differ for log=False.
+
+    Parameters:
+        M:
+            returns, numpy array or DataFrame of shape (T, N)
+        bench:
+            benchmark return, default 0.
+        log:
+            log returns or not, as in sharpe_iid. Default True.
+        target_sharpe:
+            target sharpe ratio of PSR and MinTRL
+        prob:
+            minimum probability for MinTRL
+        chunk_size:
+            rows per chunk, default None (one chunk)
+
+    Returns:
+        SharpeStats namedtuple of arrays of shape (N,): T (observations per
+        strategy), sharpe, skew, kurtosis (not excess, as psr expects),
+        adjusted_sharpe, psr, dsr and min_trl. Sharpe ratios are per
+        observation (factor=1), skew and kurtosis are the bias corrected
+        estimators of pandas. DSR deflates with the dispersion of the N
+        Sharpe ratios and is NaN for N < 5, see expected_max.
+    """
+    if isinstance(M, pd.DataFrame):
+        M = M.values
+    T, N = M.shape
+    chunk_size = T if chunk_size is None else int(chunk_size)
+
+    # nan aware power sums around a per strategy shift, which keeps the
+    # higher moments from cancelling: of the log excess returns for the
+    # Sharpe ratio (as sharpe_iid) and of the returns as given for skew and
+    # kurtosis (as psr_from_returns and sharpe_iid_adjusted)
+    excess_sums = _PowerSums(N, 2)
+    return_sums = _PowerSums(N, 4)
+    for start in range(0, T, chunk_size):
+        chunk = np.asarray(M[start:start + chunk_size], dtype=np.float64)
+        excess_sums.add(log_excess(chunk, bench) if log else pct_to_log_excess(chunk, bench))
+        return_sums.add(chunk)
+
+    n, m1, m2 = excess_sums.count, excess_sums.mean(), excess_sums.central_moment(2)
+    sharpe = (excess_sums.shift + m1) / np.sqrt(m2 * n / (n - 1))
+
+    n_r, r2 = return_sums.count, return_sums.central_moment(2)
+    r3, r4 = return_sums.central_moment(3), return_sums.central_moment(4)
+    skew = r3 / r2 ** 1.5 * np.sqrt(n_r * (n_r - 1)) / (n_r - 2)
+    excess_kurtosis = ((n_r + 1) * (r4 / r2 ** 2 - 3) + 6) * (n_r - 1) / ((n_r - 2) * (n_r - 3))
+    kurtosis = excess_kurtosis + 3
+
+    psr_stat = psr(sharpe, n, skew, kurtosis, target_sharpe)
+    if N >= 5:
+        sharpe_std = np.std(sharpe, ddof=1)
+        dsr_stat = dsr(sharpe, sharpe_std, N, n, skew, kurtosis)
+    else:
+        dsr_stat = np.full(N, np.nan)
+    with np.errstate(divide="ignore"):
+        min_trl = minTRL(sharpe, skew, kurtosis, target_sharpe=target_sharpe, prob=prob)
+
+    return SharpeStats(
+        n,
+        sharpe,
+        skew,
+        kurtosis,
+        adjusted_sharpe(sharpe, skew, excess_kurtosis),
+        psr_stat,
+        dsr_stat,
+        min_trl,
+    )
+
+
+class _PowerSums:
+    """Nan aware power sums of the columns of chunks of rows, around the
+    column means of the first chunk."""
+
+    def __init__(self, N, order):
+        self.count = np.zeros(N)
+        self.sums = np.zeros((order, N))
+        self.shift = None
+
+    def add(self, x):
+        if self.shift is None:
+            self.shift = np.nan_to_num(np.nanmean(x, axis=0))
+        valid = ~np.isnan(x)
+        x = np.where(valid, x - self.shift, 0.0)
+        self.count += valid.sum(axis=0)
+        x_power = np.ones_like(x)
+        for k in range(len(self.sums)):
+            x_power *= x
+            self.sums[k] += x_power.sum(axis=0)
+
+    def mean(self):
+        return self.sums[0] / self.count
+
+    def central_moment(self, k):
+        s = [np.ones_like(self.count)] + [power_sum / self.count for power_sum in self.sums]
+        m1 = s[1]
+        return sum(spec.comb(k, j) * s[j] * (-m1) ** (k - j) for j in range(k + 1))
+
+
 def expected_max(N):
     """
     Expected maximum of IID random variance X_n ~ Z, n = 1,...,N,
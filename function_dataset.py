@@ -0,0 +1,186 @@
+"""
+This code contains the on-disk dataset store written by the download scripts and read by the optimize and backtest
+scripts.
+
+save_dataset(data_folder, data_from_processor, price_array, tech_array, time_array) writes every array as a .npy file
+and describes them in a small manifest.json. The float64 columns of data_from_processor are stored as one 2-D array,
+its index and every other column ('tic', integer or string columns) as separate 1-D arrays. The manifest records the
+column order, the column dtypes, the index name and the time zones of the index and time_array, so load_dataset
+returns the frame and time_array as they were saved.
+
+load_dataset(data_folder, mmap_mode='r') reads the manifest and memory-maps the .npy files, so repeated loads in
+every trial and in every worker process share the same pages of the OS page cache instead of unpickling a private
+copy each time. The arrays are read-only. Folders written before the store existed (pickle files without a manifest)
+are still loaded through pickle.
+
+dataset_reference(data_folder) returns a small JSON serializable reference {'path': ..., 'hash': ...} to a dataset.
+The sha256 content hash is computed once by save_dataset and kept in the manifest. Optuna trials store this reference
+instead of copies of the price, tech and time arrays.
+
+save_trial_artifacts(trial, results_folder, **artifacts) writes the large per-trial results (returns of every split,
+backtest paths, ...) to {results_folder}/trial_artifacts/trial_{number}.npz and records the file in the trial's
+user_attrs. Lists of arrays of different lengths are stored element by element. load_trial_artifact(trial, name)
+reads one of them back and falls back to the trial's user_attrs, for small values and for studies written before the
+artifact store existed.
+"""
+
+import os
+import json
+import pickle
+import hashlib
+import functools
+import numpy as np
+import pandas as pd
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 2
+
+
+def save_dataset(data_folder, data_from_processor, price_array, tech_array, time_array):
+    os.makedirs(data_folder, exist_ok=True)
+
+    time_array = pd.DatetimeIndex(time_array)
+    frame_index = pd.DatetimeIndex(data_from_processor.index)
+    columns = list(data_from_processor.columns)
+    dtypes = [str(dtype) for dtype in data_from_processor.dtypes]
+    # float64 columns share one 2-D array, every other column (tic, ints, strings, ...) gets its own array
+    float_columns = [column for column, dtype in zip(columns, data_from_processor.dtypes) if dtype == np.float64]
+    arrays = {
+        'price_array': np.ascontiguousarray(price_array),
+        'tech_array': np.ascontiguousarray(tech_array),
+        'time_array': time_array.values,
+        'frame_values': np.ascontiguousarray(data_from_processor[float_columns].to_numpy(dtype=np.float64)),
+        'frame_index': frame_index.values,
+    }
+    other_columns = {}
+    for position, (column, dtype) in enumerate(zip(columns, data_from_processor.dtypes)):
+        if column not in float_columns:
+            values = data_from_processor[column].to_numpy()
+            if values.dtype == object:
+                values = values.astype(str)
+            other_columns[column] = f'frame_column_{position}'
+            arrays[f'frame_column_{position}'] = values
+
+    # Times are stored as naive UTC datetime64, the time zones are restored on load
+    manifest = {'version': MANIFEST_VERSION,
+                'frame_columns': columns,
+                'frame_dtypes': dtypes,
+                'frame_float_columns': float_columns,
+                'frame_other_columns': other_columns,
+                'frame_index_name': frame_index.name,
+                'frame_index_tz': _tz_name(frame_index),
+                'time_array_name': time_array.name,
+                'time_array_tz': _tz_name(time_array),
+                'arrays': {}}
+    content_hash = hashlib.sha256()
+    for name, array in arrays.items():
+        np.save(os.path.join(data_folder, f'{name}.npy'), array)
+        manifest['arrays'][name] = {'file': f'{name}.npy', 'dtype': str(array.dtype), 'shape': list(array.shape)}
+        content_hash.update(name.encode())
+        content_hash.update(np.ascontiguousarray(array).reshape(-1).view(np.uint8))
+    content_hash.update(json.dumps({key: value for key, value in manifest.items() if key != 'arrays'}).encode())
+    manifest['hash'] = content_hash.hexdigest()
+
+    # Manifest last, a folder with a manifest is complete
+    with open(os.path.join(data_folder, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def load_dataset(data_folder, mmap_mode='r'):
+    manifest_path = os.path.join(data_folder, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return _load_pickled_dataset(data_folder)
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    arrays = {name: np.load(os.path.join(data_folder, entry['file']), mmap_mode=mmap_mode)
+              for name, entry in manifest['arrays'].items()}
+
+    time_array = _to_datetime_index(arrays['time_array'], manifest['time_array_name'], manifest['time_array_tz'])
+    frame_index = _to_datetime_index(arrays['frame_index'], manifest['frame_index_name'], manifest['frame_index_tz'])
+    data_from_processor = pd.DataFrame(arrays['frame_values'],
+                                       index=frame_index,
+                                       columns=manifest['frame_float_columns'],
+                                       copy=False)
+    for column, name in manifest['frame_other_columns'].items():
+        data_from_processor[column] = arrays[name]
+    data_from_processor = data_from_processor[manifest['frame_columns']]
+    dtypes = dict(zip(manifest['frame_columns'], manifest['frame_dtypes']))
+    changed = {column: dtype for column, dtype in dtypes.items()
+               if str(data_from_processor[column].dtype) != dtype}
+    if changed:
+        data_from_processor = data_from_processor.astype(changed)
+    return data_from_processor, arrays['price_array'], arrays['tech_array'], time_array
+
+
+def _tz_name(times):
+    return None if times.tz is None else str(times.tz)
+
+
+def _to_datetime_index(values, name, tz):
+    times = pd.DatetimeIndex(values, name=name)
+    return times if tz is None else times.tz_localize('UTC').tz_convert(tz)
+
+
+def _load_pickled_dataset(data_folder):
+    loaded = []
+    for name in ['data_from_processor', 'price_array', 'tech_array', 'time_array']:
+        with open(os.path.join(data_folder, name), 'rb') as handle:
+            loaded.append(pickle.load(handle))
+    return tuple(loaded)
+
+
+def dataset_reference(data_folder):
+    manifest_path = os.path.join(data_folder, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            content_hash = json.load(f)['hash']
+    else:
+        content_hash = _hash_pickled_dataset(os.path.abspath(data_folder))
+    return {'path': data_folder, 'hash': content_hash}
+
+
+@functools.lru_cache(maxsize=None)
+def _hash_pickled_dataset(data_folder):
+    content_hash = hashlib.sha256()
+    for name in ['data_from_processor', 'price_array', 'tech_array', 'time_array']:
+        content_hash.update(name.encode())
+        with open(os.path.join(data_folder, name), 'rb') as handle:
+            for block in iter(lambda: handle.read(1 << 20), b''):
+                content_hash.update(block)
+    return content_hash.hexdigest()
+
+
+# Trial artifacts
+#######################################################################################################
+
+def save_trial_artifacts(trial, results_folder, **artifacts):
+    artifact_folder = os.path.join(results_folder, 'trial_artifacts')
+    os.makedirs(artifact_folder, exist_ok=True)
+    file_path = os.path.join(artifact_folder, f'trial_{trial.number}.npz')
+
+    arrays = {}
+    for name, value in artifacts.items():
+        if isinstance(value, (list, tuple)):
+            arrays[f'{name}/len'] = np.array(len(value))
+            for i, item in enumerate(value):
+                arrays[f'{name}/{i}'] = np.asarray(item)
+        else:
+            arrays[name] = np.asarray(value)
+
+    tmp_path = f'{file_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as handle:
+        np.savez(handle, **arrays)
+    os.replace(tmp_path, file_path)
+    trial.set_user_attr('artifacts', file_path)
+
+
+def load_trial_artifact(trial, name):
+    file_path = trial.user_attrs.get('artifacts')
+    if file_path is not None:
+        with np.load(file_path) as artifacts:
+            if f'{name}/len' in artifacts.files:
+                return [artifacts[f'{name}/{i}'] for i in range(int(artifacts[f'{name}/len']))]
+            if name in artifacts.files:
+                return artifacts[name]
+    return trial.user_attrs[name]
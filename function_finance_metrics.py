@@ -16,6 +16,17 @@ given data.
 plot_pdf(sharpe_list_drl, sharpe_hodl, name, if_range_hodl=False)
 plots the probability density function of the sharpe ratio for the provided lists and saves it with the given name.
 
+MetricsAccumulator(factor=1, bench=0, log=True) updates Sharpe, Sortino, volatility, max drawdown and Calmar ratio in
+O(1) per bar (or per chunk of bars) without keeping the return series, and merges with accumulators of later chunks or
+other CV splits.
+
+drawdown_ndarray(equity), max_drawdown_ndarray(array), sharpe_iid_rolling(...) and sortino_iid_rolling(...) work on
+whole T x N matrices (one column per trial/split) with np.maximum.accumulate and cumulative-sum windows, no column loop.
+
+compute_eqw(price_ary, indx1, indx2) computes the equal-weight portfolio with one matrix product, eqw_benchmark(...)
+adds its Sharpe ratio and caches both per dataset hash and index range, so every trial of a study reuses the HODL
+benchmark of a split.
+
 Etcetera... take your pick
 """
 
@@ -27,7 +38,9 @@ import matplotlib.pyplot as plt
 import scipy.stats as ss
 import statsmodels.tsa.stattools as sts
 import warnings
+import hashlib
 import scipy.stats
+from collections import OrderedDict
 
 # default no. of trading days in a year, 252.
 trading_days = 365
@@ -115,17 +128,65 @@ def plot_pdf(sharpe_list_drl, sharpe_hodl, name, if_range_hodl=False):
 
 def compute_eqw(price_ary, indx1, indx2):
     # compute eqw
+    price_ary = np.asarray(price_ary, dtype=np.float64)
     initial_prices = price_ary[0, :]
-    equal_weight = np.array([1e6 / len(initial_prices) / initial_prices[i] for i in range(len(initial_prices))])
-    account_value_eqw = []
-    for i in range(0, price_ary.shape[0]):
-        account_value_eqw.append(np.sum(equal_weight * price_ary[i]))
-    eqw_cumrets = [x / account_value_eqw[0] - 1 for x in account_value_eqw]
-    account_value_eqw = np.array(account_value_eqw)
+    equal_weight = 1e6 / len(initial_prices) / initial_prices
+    account_value_eqw = price_ary @ equal_weight
+    eqw_cumrets = account_value_eqw / account_value_eqw[0] - 1
     eqw_rets_tmp = account_value_eqw[:-1] / account_value_eqw[1:] - 1
     return account_value_eqw, eqw_rets_tmp, eqw_cumrets
 
 
+EQW_CACHE_SIZE = 256
+_eqw_cache = OrderedDict()
+
+
+def eqw_benchmark(price_array, indices, data_points_per_year, dataset_hash=None):
+    """
+    Equal-weight (buy-and-hold) benchmark of price_array[indices] and its
+    annualized Sharpe ratio.
+
+    The benchmark depends only on the prices and the indices, so with a
+    dataset_hash the result is kept in an LRU cache keyed on the dataset hash
+    and the index range and shared by all trials. The cached arrays are
+    read-only.
+
+    Returns
+    -------
+    (account_value_eqw, eqw_rets, eqw_cumrets, factor, sharpe_eqw)
+    """
+    key = None
+    if dataset_hash is not None:
+        key = (dataset_hash, _index_key(indices), data_points_per_year)
+        if key in _eqw_cache:
+            _eqw_cache.move_to_end(key)
+            return _eqw_cache[key]
+
+    account_value_eqw, eqw_rets, eqw_cumrets = compute_eqw(price_array[indices, :], None, None)
+    factor = data_points_per_year / np.shape(eqw_rets)[0]
+    sharpe_eqw, _ = sharpe_iid(eqw_rets, bench=0, factor=factor, log=False)
+    for array in (account_value_eqw, eqw_rets, eqw_cumrets):
+        array.flags.writeable = False
+    result = (account_value_eqw, eqw_rets, eqw_cumrets, factor, sharpe_eqw)
+
+    if key is not None:
+        _eqw_cache[key] = result
+        if len(_eqw_cache) > EQW_CACHE_SIZE:
+            _eqw_cache.popitem(last=False)
+    return result
+
+
+def _index_key(indices):
+    """Hashable key of an index array, (start, stop) for contiguous ranges and a digest otherwise."""
+    indices = np.asarray(indices)
+    if indices.dtype == bool:
+        indices = np.flatnonzero(indices)
+    if len(indices) == 0 or np.all(np.diff(indices) == 1):
+        return ('range', int(indices[0]) if len(indices) else 0, int(indices[-1]) + 1 if len(indices) else 0)
+    indices = np.ascontiguousarray(indices, dtype=np.int64)
+    return ('indices', len(indices), hashlib.sha1(indices.view(np.uint8)).hexdigest())
+
+
 def calc_annualized_ret(cum_ret, points_per_year):
     dataset_size = np.shape(cum_ret)[0]
     factor = points_per_year / dataset_size
@@ -480,8 +541,66 @@ def sharpe_iid_rolling(
     else:
         excess = pct_to_log_excess(rtns, bench)
 
-    roll = excess.rolling(window=window, min_periods=min_periods)
-    return np.sqrt(factor) * roll.mean() / roll.std(ddof=1)
+    sharpe = np.sqrt(factor) * _rolling_sharpe(np.asarray(excess, dtype=np.float64), window, min_periods)
+    if _is_pandas(excess):
+        return excess._constructor(sharpe, index=excess.index, **_pandas_columns(excess))
+    return sharpe
+
+
+def sortino_iid_rolling(
+        rtns, window: int, min_periods: int, bench=0, factor=1, log=True
+):
+    """
+    Rolling sortino ratio, the rolling version of sortino_iid (semi deviation
+    of the negative excess returns over the whole window).
+    """
+    if log:
+        excess = log_excess(rtns, bench)
+    else:
+        excess = pct_to_log_excess(rtns, bench)
+
+    sortino = np.sqrt(factor) * _rolling_sortino(np.asarray(excess, dtype=np.float64), window, min_periods)
+    if _is_pandas(excess):
+        return excess._constructor(sortino, index=excess.index, **_pandas_columns(excess))
+    return sortino
+
+
+def _pandas_columns(d):
+    return {'columns': d.columns} if isinstance(d, pd.DataFrame) else {'name': d.name}
+
+
+def _rolling_sum(x, window):
+    """Column-wise sums over trailing windows of `window` rows (fewer at the start) from one cumulative sum."""
+    cum = np.cumsum(x, axis=0)
+    cum[window:] = cum[window:] - cum[:-window].copy()
+    return cum
+
+
+def _rolling_moments(excess, window, min_periods):
+    """Rolling count, mean and centered values of a 1-D or 2-D (T x N) array, NaNs are skipped like pandas."""
+    valid = ~np.isnan(excess)
+    # centering on the column mean keeps the cumulative sums small
+    shift = np.nan_to_num(np.nanmean(excess, axis=0)) if valid.any() else 0.0
+    centered = np.where(valid, excess - shift, 0.0)
+    count = _rolling_sum(valid.astype(np.float64), window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = _rolling_sum(centered, window) / count
+    mean[count < (window if min_periods is None else min_periods)] = np.nan
+    return count, mean, centered, shift
+
+
+def _rolling_sharpe(excess, window, min_periods):
+    count, mean, centered, shift = _rolling_moments(excess, window, min_periods)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var = (_rolling_sum(centered ** 2, window) - mean ** 2 * count) / (count - 1)
+        return (mean + shift) / np.sqrt(np.maximum(var, 0))
+
+
+def _rolling_sortino(excess, window, min_periods):
+    count, mean, _, shift = _rolling_moments(excess, window, min_periods)
+    downside_sq = _rolling_sum(np.square(np.minimum(np.nan_to_num(excess), 0)), window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (mean + shift) / np.sqrt(downside_sq / count)
 
 
 def sharpe_iid_adjusted(rtns, bench=0, factor=1, log=True):
@@ -725,20 +844,27 @@ def tail_ratio(returns, tail_prob=5):
 
 
 def max_drawdown_single(rets, factor):
-    rets = np.delete(rets, 0)
-    rets = pd.Series(rets)
-    Roll_Max = rets.rolling(factor, min_periods=1).max()
+    rets = np.asarray(rets, dtype=np.float64)[1:]
+    Roll_Max = _rolling_max(rets, factor)
     inter_point_dd = rets / Roll_Max - 1.0
-    max_interpoint_dd = inter_point_dd.rolling(factor, min_periods=1).min()
+    max_interpoint_dd = -_rolling_max(-inter_point_dd, factor)
     return max_interpoint_dd
 
 
+def _rolling_max(x, window):
+    """Column-wise max over trailing windows of `window` rows (fewer at the start), NaNs are skipped like pandas."""
+    padded = np.concatenate((np.full((window - 1,) + x.shape[1:], np.nan), x))
+    with warnings.catch_warnings():
+        # all-NaN windows stay NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmax(np.lib.stride_tricks.sliding_window_view(padded, window, axis=0), axis=-1)
+
+
 def max_drawdown_ndarray(array):
-    max_dd_list = []
-    for i in range(np.shape(array)[1]):
-        max_dd = max_drawdown_single(array[:, i])
-        max_dd_list.append(max_dd)
-    return max_dd_list
+    """Max drawdown of every column of a 1-D or 2-D (T x N) equity array."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmin(drawdown_ndarray(array), axis=0)
 
 
 def max_drawdown(equity):
@@ -749,6 +875,16 @@ def max_drawdown_from_rtns(returns, log=True):
     return drawdown_from_rtns(returns, log=log).min()
 
 
+def drawdown_ndarray(equity):
+    """
+    Drawdown curves of a 1-D or 2-D (T x N) equity array, column-wise in
+    percentage terms from the running peak. NaNs are skipped by the running
+    peak (like pandas expanding().max()) and stay NaN in the curve.
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    return equity / np.fmax.accumulate(equity, axis=0) - 1.0
+
+
 def drawdown(equity) -> pd.DataFrame:
     """
     Drawdown curve.
@@ -760,9 +896,8 @@ def drawdown(equity) -> pd.DataFrame:
     """
     if isinstance(equity, np.ndarray) or isinstance(equity, list):
         equity = pd.DataFrame(equity)
-    highs = equity.expanding().max()
-    dd = equity / highs - 1.0
-    return dd
+    dd = drawdown_ndarray(equity.values)
+    return equity._constructor(dd, index=equity.index, **_pandas_columns(equity))
 
 
 def drawdown_from_rtns(returns, log=True):
@@ -816,6 +951,134 @@ def calmar_ratio(returns, factor=trading_days, log=True):
     return annual_return / max_dd
 
 
+class MetricsAccumulator:
+    """
+    Streaming performance metrics of a return series.
+
+    The excess log returns are summarized by Welford / Chan moments (count, mean, sum of squared deviations) and the
+    sum of squared negative excess returns, the log equity curve by its total, highest and lowest level and its
+    deepest drawdown. Every update and merge is O(1) in the number of bars seen so far, nothing else is stored.
+
+    Like max_drawdown_from_rtns and calmar_ratio, the running peak starts at the equity after the first bar, not at
+    the initial capital: a loss on the first bar is not a drawdown. Pct returns are converted with pct_to_log_return,
+    so with log=False the results carry its 1e-8 per bar offset, as annual_geometric_returns does.
+
+    a.merge(b) appends the bars of b after the bars of a, for chunks of one series or for consecutive CV splits. The
+    moments do not depend on the order, the drawdown state does.
+
+    Parameters
+    ----------
+    factor : int, optional
+        annualization factor, e.g. compute_data_points_per_year(timeframe)
+    bench : float, optional
+        constant benchmark return per bar, as in sharpe_iid
+    log : bool, optional
+        True if log returns are passed to update, False for percentage returns
+    """
+
+    def __init__(self, factor=1, bench=0, log=True):
+        self.factor = factor
+        self.bench = bench
+        self.log = log
+
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.downside_sq = 0.0
+
+        # log equity relative to the start: current level, highest and lowest level after a bar (-inf / inf before
+        # the first bar), deepest drawdown (<= 0)
+        self.total = 0.0
+        self.peak = -np.inf
+        self.trough = np.inf
+        self.max_dd_log = 0.0
+
+    @classmethod
+    def from_returns(cls, returns, factor=1, bench=0, log=True):
+        accumulator = cls(factor=factor, bench=bench, log=log)
+        accumulator.update(returns)
+        return accumulator
+
+    def update(self, returns):
+        """Add one return or a 1-D array of consecutive returns."""
+        returns = np.atleast_1d(np.asarray(returns, dtype=np.float64))
+        if returns.size == 0:
+            return self
+        if self.log:
+            log_rtns = returns
+            excess = log_excess(returns, self.bench)
+        else:
+            log_rtns = pct_to_log_return(returns)
+            excess = pct_to_log_excess(returns, self.bench)
+
+        chunk = MetricsAccumulator(self.factor, self.bench, self.log)
+        chunk.count = returns.size
+        chunk.mean = excess.mean()
+        chunk.m2 = np.square(excess - chunk.mean).sum()
+        chunk.downside_sq = np.square(np.minimum(excess, 0)).sum()
+
+        level = np.cumsum(log_rtns)
+        running_peak = np.maximum.accumulate(level)
+        chunk.total = level[-1]
+        chunk.peak = running_peak[-1]
+        chunk.trough = level.min()
+        chunk.max_dd_log = (level - running_peak).min()
+        return self.merge(chunk)
+
+    def merge(self, other):
+        """Append the bars summarized by `other` after the bars of this accumulator, in place."""
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.downside_sq += other.downside_sq
+        self.count = count
+
+        # drawdowns of the appended bars are measured from the higher of both peaks, with no bars before there is no
+        # peak yet (-inf) and only the drawdowns within `other` count
+        self.max_dd_log = min(self.max_dd_log, other.max_dd_log, self.total - self.peak + other.trough)
+        self.trough = min(self.trough, self.total + other.trough)
+        self.peak = max(self.peak, self.total + other.peak)
+        self.total += other.total
+        return self
+
+    @property
+    def volatility(self):
+        return np.sqrt(self.m2 / (self.count - 1) * self.factor)
+
+    @property
+    def sharpe(self):
+        return np.sqrt(self.factor) * self.mean / np.sqrt(self.m2 / (self.count - 1))
+
+    @property
+    def sortino(self):
+        return np.sqrt(self.factor) * self.mean / np.sqrt(self.downside_sq / self.count)
+
+    @property
+    def max_drawdown(self):
+        return np.expm1(self.max_dd_log)
+
+    @property
+    def annual_return(self):
+        return np.expm1(self.total * self.factor / self.count)
+
+    @property
+    def calmar(self):
+        return self.annual_return / np.abs(self.max_drawdown)
+
+    def metrics(self):
+        return {
+            'sharpe': self.sharpe,
+            'sortino': self.sortino,
+            'volatility': self.volatility,
+            'max_drawdown': self.max_drawdown,
+            'annual_return': self.annual_return,
+            'calmar': self.calmar,
+        }
+
+
 def write_metrics_to_results(name, file_path, drl_cumrets, drl_annual_ret, drl_annual_vol, drl_sharpe_rat, vol,
                              append_write):
     with open(file_path, append_write) as f:
@@ -0,0 +1,101 @@
+"""
+This code contains the helpers that let the optimize scripts run one Optuna study from several processes.
+
+study_storage_url(path) returns the SQLite storage url of a study that lives in the result folder `path`.
+
+optimize_parallel(study_name, storage, objectives, samplers, n_trials, pruner, callbacks, catch) spawns one process per
+(objective, sampler) pair. Every process loads the same study from the shared storage and runs its share of the
+n_trials trials, so the trials of the study are evaluated concurrently. Objectives and callbacks have to be picklable,
+e.g. module level functions or functools.partial objects of them.
+
+study_lock(path) is a context manager around an exclusive file lock in the result folder (fcntl on POSIX, msvcrt on
+Windows). It serializes the parts of the trial callbacks that write shared files, such as copying the best agent.
+
+dump_study(study, file_path) pickles the study with joblib. A study backed by a database is first copied into an
+in-memory study, so the pickle stays self-contained as before, and the file is replaced atomically so readers never
+see a partially written pickle. The optimize scripts dump the study when a trial becomes the best one and once after
+the optimization, not after every trial, as copying a database backed study costs O(trials).
+"""
+
+import os
+import joblib
+import optuna
+import multiprocessing as mp
+from contextlib import contextmanager
+from optuna.trial import TrialState
+
+
+def study_storage_url(path):
+    return f"sqlite:///{os.path.join(path, 'study.db')}"
+
+
+def optimize_parallel(study_name, storage, objectives, samplers, n_trials, pruner, callbacks=None, catch=()):
+    n_workers = len(objectives)
+    n_trials_workers = [n_trials // n_workers + (worker_id < n_trials % n_workers) for worker_id in range(n_workers)]
+
+    context = mp.get_context("spawn")
+    processes = [context.Process(target=_optimize_worker,
+                                 args=(study_name, storage, objective, n_trials_worker, sampler, pruner, callbacks,
+                                       catch))
+                 for objective, sampler, n_trials_worker in zip(objectives, samplers, n_trials_workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    failed = [process.exitcode for process in processes if process.exitcode != 0]
+    if failed:
+        raise RuntimeError(f'{len(failed)} of {n_workers} optimization workers failed, exit codes: {failed}')
+    return optuna.load_study(study_name=study_name, storage=storage)
+
+
+def _optimize_worker(study_name, storage, objective, n_trials, sampler, pruner, callbacks, catch):
+    study = optuna.load_study(study_name=study_name, storage=storage, sampler=sampler, pruner=pruner)
+    study.optimize(objective, n_trials=n_trials, catch=catch, callbacks=callbacks)
+
+
+@contextmanager
+def study_lock(path):
+    with open(os.path.join(path, '.study.lock'), 'w') as handle:
+        _lock_file(handle)
+        try:
+            yield
+        finally:
+            _unlock_file(handle)
+
+
+# fcntl only exists on POSIX and msvcrt only on Windows, so both are imported where they are used
+def _lock_file(handle):
+    if os.name == 'nt':
+        import msvcrt
+        while True:
+            try:
+                msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:  # LK_LOCK gives up after 10 seconds
+                continue
+    else:
+        import fcntl
+        fcntl.flock(handle, fcntl.LOCK_EX)
+
+
+def _unlock_file(handle):
+    if os.name == 'nt':
+        import msvcrt
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def dump_study(study, file_path):
+    if not isinstance(study._storage, optuna.storages.InMemoryStorage):
+        snapshot = optuna.create_study(study_name=study.study_name, direction=study.direction)
+        snapshot.add_trials(study.get_trials(deepcopy=False, states=(TrialState.COMPLETE,
+                                                                     TrialState.PRUNED,
+                                                                     TrialState.FAIL)))
+        study = snapshot
+
+    tmp_path = f'{file_path}.{os.getpid()}.tmp'
+    joblib.dump(study, tmp_path)
+    os.replace(tmp_path, file_path)
@@ -0,0 +1,56 @@
+"""
+This code contains the per-study precomputation shared by all trials of the optimize scripts.
+
+Everything that depends only on the dataset and the cross-validation settings, never on the sampled hyperparameters,
+is computed once per study instead of once per trial: the CV splits, the test price slices, the equal-weight (HODL)
+benchmark returns, the annualization factors and the HODL Sharpe ratios of every split.
+
+study_cache(data_folder, timeframe, build_splits) loads the dataset, calls build_splits(data_from_processor,
+price_array, tech_array, time_array) -> (splits, extras) and precomputes a SplitBenchmark for every (train_indices,
+test_indices) split. The result is kept per process, keyed on the dataset content hash and the split builder, so the
+first trial of a study (per optimization worker) builds it and all later trials only read it. All cached arrays are
+read-only.
+
+SplitBenchmark(price_array_test, eqw_rets, factor, sharpe_eqw) holds the per-split values test_agent needs for the
+benchmark, it is passed on to train_and_test / test_agent.
+"""
+
+import numpy as np
+from collections import namedtuple
+from function_dataset import load_dataset, dataset_reference
+from function_finance_metrics import compute_data_points_per_year, eqw_benchmark
+
+StudyCache = namedtuple('StudyCache', ['dataset', 'dataset_hash', 'splits', 'benchmarks', 'extras'])
+SplitBenchmark = namedtuple('SplitBenchmark', ['price_array_test', 'eqw_rets', 'factor', 'sharpe_eqw'])
+
+_study_caches = {}
+
+
+def study_cache(data_folder, timeframe, build_splits):
+    dataset_hash = dataset_reference(data_folder)['hash']
+    cache_key = (dataset_hash, timeframe, build_splits.__module__, build_splits.__qualname__)
+    if cache_key in _study_caches:
+        return _study_caches[cache_key]
+
+    dataset = load_dataset(data_folder)
+    data_from_processor, price_array, tech_array, time_array = dataset
+    splits, extras = build_splits(data_from_processor, price_array, tech_array, time_array)
+    splits = [(_read_only(train_indices), _read_only(test_indices)) for train_indices, test_indices in splits]
+
+    data_points_per_year = compute_data_points_per_year(timeframe)
+    benchmarks = []
+    for _, test_indices in splits:
+        _, eqw_rets, _, factor, sharpe_eqw = eqw_benchmark(price_array, test_indices, data_points_per_year,
+                                                           dataset_hash)
+        benchmarks.append(SplitBenchmark(_read_only(price_array[test_indices, :]), eqw_rets, factor, sharpe_eqw))
+
+    extras = {name: _read_only(value) if isinstance(value, np.ndarray) else value for name, value in extras.items()}
+    cache = StudyCache(dataset, dataset_hash, splits, benchmarks, extras)
+    _study_caches[cache_key] = cache
+    return cache
+
+
+def _read_only(array):
+    array = np.asarray(array)
+    array.flags.writeable = False
+    return array
@@ -0,0 +1,131 @@
+"""
+This code contains the trading engine shared by the Alpaca environment and the offline backtests.
+
+trade_step(actions, price, stocks, stocks_cooldown, cash, minimum_qty, ...) executes one bar of orders for one
+portfolio (1-D stocks, scalar cash) or for a batch of portfolios (2-D stocks, 1-D cash) with array operations. The
+arrays are either all NumPy arrays (CryptoEnvAlpaca, backtest_actor) or all torch tensors (CryptoVecEnvAlpaca). The
+rules are the ones CryptoEnvAlpaca.step always had:
+
+    1. the cooldown of every held coin is increased by one bar
+    2. sell orders below -minimum_qty are executed for held coins with a positive price, resetting their cooldown
+    3. coins whose cooldown reached cooldown_limit are forced to sell force_sell_pct of the position
+    4. buy orders above minimum_qty are executed coin after coin, limited by the fee corrected cash times the safety
+       factor, and dropped when the resulting quantity is below minimum_qty
+
+Sells of different coins do not influence each other and are executed all at once. Buys are visited in coin order,
+because every buy reduces the cash left for the next one.
+
+backtest_actor(act, environment, device) runs a deterministic actor over the whole window of a CryptoEnvAlpaca
+instance and returns the same episode_total_assets curve as stepping the environment bar by bar. The tech part of the
+first actor layer is computed for the whole window in one batched matmul, so every bar only feeds cash and holdings
+through the network, and the total asset curve is computed in one pass after the episode.
+"""
+
+import copy
+import numpy as np
+import torch
+import torch.nn as nn
+
+
+def trade_step(actions, price, stocks, stocks_cooldown, cash, minimum_qty, buy_cost_pct=0.003, sell_cost_pct=0.003,
+               safety_factor_stock_buy=0.9, cooldown_limit=48, force_sell_pct=0.05):
+    """Executes the scaled `actions` (in coins) at `price`, updates `stocks` and `stocks_cooldown` in place and
+    returns the new cash."""
+    xp = torch if isinstance(stocks, torch.Tensor) else np
+
+    # if a stock is held add to its cooldown
+    stocks_cooldown += stocks > 0
+
+    # Sell
+    sell_mask = (actions < -minimum_qty) & (stocks > 0) & (price > 0)
+    if sell_mask.any():
+        sell_num_shares = xp.where(sell_mask, xp.minimum(stocks, -actions), 0)
+        stocks_cooldown[sell_mask] = 0
+        stocks -= sell_num_shares
+        cash = cash + (price * sell_num_shares).sum(axis=-1) * (1 - sell_cost_pct)
+
+    # Force sell
+    force_mask = stocks_cooldown >= cooldown_limit
+    if force_mask.any():
+        sell_num_shares = xp.where(force_mask, stocks * force_sell_pct, 0)
+        stocks_cooldown[force_mask] = 0
+        stocks -= sell_num_shares
+        cash = cash + (price * sell_num_shares).sum(axis=-1) * (1 - sell_cost_pct)
+
+    # Buy, only coins with a buy order in some portfolio and a price > 0 (no missing data in this particular date)
+    buy_coins = (actions > minimum_qty).reshape(-1, price.shape[0]).any(axis=0) & (price > 0)
+    for index in [index for index, buy in enumerate(buy_coins.tolist()) if buy]:
+        action = actions[..., index]
+        fee_corrected_asset = cash / (1 + buy_cost_pct)
+        max_stocks_can_buy = (fee_corrected_asset / price[index]) * safety_factor_stock_buy
+        buy_num_shares = xp.minimum(max_stocks_can_buy, action)
+        buy_mask = (action > minimum_qty[index]) & (buy_num_shares >= minimum_qty[index])
+        buy_num_shares = xp.where(buy_mask, buy_num_shares, 0)
+        stocks[..., index] += buy_num_shares
+        cash = cash - price[index] * buy_num_shares * (1 + buy_cost_pct)
+
+    return cash
+
+
+class _TechProjectedLinear(nn.Module):
+    """First actor layer that takes only the portfolio part of the state, the tech part of every row of the window is
+    projected once up front. Set `row` to the window row of the current bar before calling the actor."""
+
+    def __init__(self, linear, tech_window, portfolio_dim):
+        super().__init__()
+        weight = linear.weight.detach()
+        self.weight_portfolio_t = weight[:, :portfolio_dim].t().contiguous()
+        self.tech_proj = torch.addmm(linear.bias.detach(), tech_window, weight[:, portfolio_dim:].t())
+        self.row = 0
+
+    def forward(self, portfolio):
+        return torch.addmm(self.tech_proj[self.row:self.row + 1], portfolio, self.weight_portfolio_t)
+
+
+def backtest_actor(act, environment, device):
+    env = environment
+    n = env.crypto_num
+    times = np.arange(env.lookback, env.max_step + 1)
+    # window rows of the observed states, the action of bar `time` sees the window ending at time - 1
+    window_rows = times - env.lookback
+    tech_window = torch.as_tensor(env.tech_window[window_rows], device=device)
+
+    # every actor starts with a Linear(state_dim, mid_dim) in `net` or `net_state`
+    net = getattr(act, "net", None)
+    net = getattr(act, "net_state", None) if net is None else net
+    if isinstance(net, nn.Sequential) and isinstance(net[0], nn.Linear):
+        act = copy.deepcopy(act)
+        net = getattr(act, "net", None)
+        net = getattr(act, "net_state", None) if net is None else net
+        first_layer = net[0] = _TechProjectedLinear(net[0], tech_window, 1 + n)
+    else:
+        first_layer = None
+
+    cash = env.initial_cash
+    stocks = np.zeros(n, dtype=np.float32)
+    stocks_cooldown = np.zeros_like(stocks)
+    cash_hist = np.empty(len(times), dtype=np.float64)
+    stocks_hist = np.empty((len(times), n), dtype=np.float32)
+    portfolio = np.empty((1, 1 + n), dtype=np.float32)
+
+    with torch.no_grad():
+        for row, time in enumerate(times):
+            portfolio[0, 0] = cash * env.norm_cash
+            portfolio[0, 1:] = stocks * env.norm_stocks
+            s_tensor = torch.from_numpy(portfolio).to(device)
+            if first_layer is None:
+                s_tensor = torch.cat((s_tensor, tech_window[row:row + 1]), dim=1)
+            else:
+                first_layer.row = row
+            action = act(s_tensor).cpu().numpy()[0]
+
+            cash = trade_step(action * env.action_norm_vector, env.price_array[time], stocks, stocks_cooldown, cash,
+                              env.minimum_qty_alpaca,
+                              buy_cost_pct=env.buy_cost_pct,
+                              sell_cost_pct=env.sell_cost_pct,
+                              safety_factor_stock_buy=env.safety_factor_stock_buy)
+            cash_hist[row] = cash
+            stocks_hist[row] = stocks
+
+    total_assets = cash_hist + (env.price_array[times] * stocks_hist).sum(axis=1)
+    return [env.initial_total_asset] + total_assets.tolist()
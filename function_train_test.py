@@ -14,22 +14,33 @@ and setting the if_train parameter to False. The function then calls the DRL_pre
 class and passes it the model_name, cwd, net_dimension, environment, and gpu_id.
 
 Finally, the function computes the Sharpe ratios for the split by first correcting the slicing of the data,
-then calling the compute_eqw() function to compute the equal-weighted Sharpe ratio, and then calling the sharpe_iid()
-function to compute the Sharpe ratio for the DRL agent. The function then returns the Sharpe ratios for the DRL agent
+then calling the eqw_benchmark() function to compute the equal-weighted Sharpe ratio (cached per dataset and split),
+and then calling the sharpe_iid() function to compute the Sharpe ratio for the DRL agent. The function then returns the Sharpe ratios for the DRL agent
 and the equal-weighted portfolio, as well as the returns for the DRL agent.
 
+train_and_test_splits() runs train_and_test() for a list of independent CV splits. With n_workers > 1 the splits are
+trained in a pool of spawned processes, every split in its own cwd, and the results are returned in split order. The
+workers get the dataset folder of the trial (its "dataset" reference) and the split indices, not the arrays, and
+memory-map the dataset themselves, so all workers share the pages of the OS page cache instead of each unpickling a
+copy of the price and tech arrays.
+With the per-split benchmarks of function_study_cache the test price slices and HODL Sharpe ratios are not recomputed.
+
 """
 
+import shutil
 import numpy as np
+from function_dataset import load_dataset
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
 from drl_agents.elegantrl_models import DRLAgent as DRLAgent_erl
 from processor_Binance import BinanceProcessor
 from function_finance_metrics import (compute_data_points_per_year,
-                                      compute_eqw,
+                                      eqw_benchmark,
                                       sharpe_iid)
 
 
 def train_and_test(trial, price_array, tech_array, train_indices, test_indices, env, model_name, env_params, erl_params,
-                   break_step, cwd, gpu_id):
+                   break_step, cwd, gpu_id, benchmark=None):
     train_agent(price_array,
                 tech_array,
                 train_indices,
@@ -48,10 +59,60 @@ def train_and_test(trial, price_array, tech_array, train_indices, test_indices,
                                                       cwd,
                                                       gpu_id,
                                                       erl_params,
-                                                      trial)
+                                                      trial.user_attrs["timeframe"],
+                                                      _dataset_hash(trial),
+                                                      benchmark)
     return sharpe_bot, sharpe_eqw, drl_rets_tmp
 
 
+def train_and_test_splits(trial, price_array, tech_array, splits, env, model_name, env_params, erl_params, break_step,
+                          cwd, gpu_id, n_workers=1, benchmarks=None):
+    if benchmarks is None:
+        benchmarks = [None] * len(splits)
+    if n_workers <= 1:
+        return [train_and_test(trial, price_array, tech_array, train_indices, test_indices, env, model_name,
+                               env_params, erl_params, break_step, cwd, gpu_id, benchmark)
+                for (train_indices, test_indices), benchmark in zip(splits, benchmarks)]
+
+    dataset = trial.user_attrs.get("dataset")
+    if not dataset:
+        raise ValueError('train_and_test_splits with n_workers > 1 needs the "dataset" reference of the trial, '
+                         'see function_dataset.dataset_reference')
+
+    # Every split trains in its own cwd, otherwise the workers overwrite each other's checkpoints
+    timeframe = trial.user_attrs["timeframe"]
+    split_cwds = [f"{cwd}_split_{split}" for split in range(len(splits))]
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp.get_context("spawn")) as executor:
+        futures = [executor.submit(_train_and_test_split, timeframe, dataset["path"], train_indices, test_indices,
+                                   env, model_name, env_params, erl_params, break_step, split_cwd, gpu_id,
+                                   dataset["hash"], benchmark)
+                   for (train_indices, test_indices), split_cwd, benchmark in zip(splits, split_cwds, benchmarks)]
+        results = [future.result() for future in futures]
+
+    # Keep the sequential layout, cwd holds the agent of the last split
+    shutil.rmtree(cwd, ignore_errors=True)
+    shutil.copytree(split_cwds[-1], cwd)
+    for split_cwd in split_cwds:
+        shutil.rmtree(split_cwd, ignore_errors=True)
+    return results
+
+
+def _train_and_test_split(timeframe, data_folder, train_indices, test_indices, env, model_name, env_params, erl_params,
+                          break_step, cwd, gpu_id, dataset_hash=None, benchmark=None):
+    # A pickled memmap arrives as a full copy, every worker maps the dataset itself instead
+    _, price_array, tech_array, _ = load_dataset(data_folder)
+    train_agent(price_array, tech_array, train_indices, env, model_name, env_params, erl_params, break_step, cwd,
+                gpu_id)
+    return test_agent(price_array, tech_array, test_indices, env, env_params, model_name, cwd, gpu_id, erl_params,
+                      timeframe, dataset_hash, benchmark)
+
+
+def _dataset_hash(trial):
+    # Content hash of the dataset the trial was run on, keys the cache of the equal-weight benchmark
+    dataset = trial.user_attrs.get("dataset")
+    return dataset.get("hash") if dataset else None
+
+
 def train_agent(price_array, tech_array, train_indices, env, model_name, env_params, erl_params, break_step, cwd,
                 gpu_id):
     print('No. Train Samples:', len(train_indices), '\n')
@@ -75,9 +136,11 @@ def train_agent(price_array, tech_array, train_indices, env, model_name, env_par
                       )
 
 
-def test_agent(price_array, tech_array, test_indices, env, env_params, model_name, cwd, gpu_id, erl_params, trial):
+def test_agent(price_array, tech_array, test_indices, env, env_params, model_name, cwd, gpu_id, erl_params, timeframe,
+               dataset_hash=None, benchmark=None):
     print('\nNo. Test Samples:', len(test_indices))
-    price_array_test = price_array[test_indices, :]
+    # Precomputed once per study (function_study_cache), otherwise sliced and computed here
+    price_array_test = price_array[test_indices, :] if benchmark is None else benchmark.price_array_test
     tech_array_test = tech_array[test_indices, :]
 
     data_config = {
@@ -100,15 +163,11 @@ def test_agent(price_array, tech_array, test_indices, env, env_params, model_nam
         environment=env_instance,
         gpu_id=gpu_id
     )
-    lookback = env_params['lookback']
-    indice_start = lookback - 1
-    indice_end = len(price_array_test) - lookback
-
-    data_points_per_year = compute_data_points_per_year(trial.user_attrs["timeframe"])
-    account_value_eqw, eqw_rets_tmp, eqw_cumrets = compute_eqw(price_array_test, indice_start, indice_end)
-    dataset_size = np.shape(eqw_rets_tmp)[0]
-    factor = data_points_per_year / dataset_size
-    sharpe_eqw, _ = sharpe_iid(eqw_rets_tmp, bench=0, factor=factor, log=False)
+    if benchmark is None:
+        data_points_per_year = compute_data_points_per_year(timeframe)
+        _, _, _, factor, sharpe_eqw = eqw_benchmark(price_array, test_indices, data_points_per_year, dataset_hash)
+    else:
+        factor, sharpe_eqw = benchmark.factor, benchmark.sharpe_eqw
 
     account_value_erl = np.array(account_value_erl)
     drl_rets_tmp = account_value_erl[1:] - account_value_erl[:-1]
@@ -27,6 +27,7 @@ import numpy as np
 import pandas as pd
 import stockstats
 import talib
+from scipy.linalg import solve_triangular
 
 from typing import List
 
@@ -155,54 +156,102 @@ class _Base:
             self.dataframe = self.dataframe.merge(turbulence_index, on="time")
             self.dataframe.sort_values(["time", "tic"], inplace=True).reset_index(drop=True, inplace=True)
 
-    def calculate_turbulence(self, time_period: int = 252) -> pd.DataFrame:
-        """calculate turbulence index based on dow 30"""
+    def calculate_turbulence(self, time_period: int = 252, recompute_every: int = 1) -> pd.DataFrame:
+        """calculate turbulence index based on dow 30
+
+        The rolling sums of the returns are updated with one rank-one add and remove per time step, the Mahalanobis
+        distance is solved with a Cholesky factor of the covariance that is refactored every `recompute_every` steps
+        (1 is exact). Windows with missing returns are computed one by one like before: the oldest rows are dropped,
+        tickers with gaps are dropped and the covariance is pseudo-inverted.
+        """
         # can add other market assets
         df_price_pivot = self.dataframe.pivot(index="time", columns="tic", values="close")
         # use returns to calculate turbulence
         df_price_pivot = df_price_pivot.pct_change()
+        returns = df_price_pivot.to_numpy(dtype=np.float64)
+        n_times = len(returns)
 
-        unique_date = self.dataframe['time'].unique()
         # start after a year
         start = time_period
-        turbulence_index = [0] * start
-        # turbulence_index = [0]
+        turbulence_index = np.zeros(n_times)
+
+        # The first row of pct_change is empty and dropped from the window, a window containing any other gap is
+        # computed exactly
+        gaps = np.isnan(returns).any(axis=1)
+        gaps[0] = False
+        gaps_before = np.concatenate([[0], np.cumsum(gaps)])
+
+        # Centered on the overall mean to keep the running sums well conditioned
+        shift = np.nan_to_num(np.nanmean(returns[1:], axis=0)) if n_times > 1 else 0.0
+        centered = np.nan_to_num(returns - shift)
+        centered[0] = 0
+        low = high = max(start - time_period, 1)
+        sum_x, sum_xx = np.zeros(returns.shape[1]), np.zeros((returns.shape[1], returns.shape[1]))
+        factor, factor_age = None, 0
+
         count = 0
-        for i in range(start, len(unique_date)):
-            current_price = df_price_pivot[df_price_pivot.index == unique_date[i]]
-            # use one year rolling window to calcualte covariance
-            hist_price = df_price_pivot[
-                (df_price_pivot.index < unique_date[i])
-                & (df_price_pivot.index >= unique_date[i - time_period])
-                ]
-            # Drop tickers which has number missing values more than the "oldest" ticker
-            filtered_hist_price = hist_price.iloc[
-                                  hist_price.isna().sum().min():
-                                  ].dropna(axis=1)
-
-            cov_temp = filtered_hist_price.cov()
-            current_temp = (current_price[list(filtered_hist_price)] - np.mean(
-                filtered_hist_price, axis=0
-            ))
-            # cov_temp = hist_price.cov()
-            # current_temp=(current_price - np.mean(hist_price,axis=0))
-
-            temp = current_temp.values.dot(np.linalg.pinv(cov_temp)).dot(
-                current_temp.values.T
-            )
+        for i in range(start, n_times):
+            window_low = max(i - time_period, 1)
+            if (i - start) % time_period == 0:
+                # recompute the sums from scratch once per window length, no drift from the updates
+                low, high = window_low, i
+                sum_x = centered[low:high].sum(axis=0)
+                sum_xx = centered[low:high].T @ centered[low:high]
+            while high < i:
+                sum_x += centered[high]
+                sum_xx += np.outer(centered[high], centered[high])
+                high += 1
+            while low < window_low:
+                sum_x -= centered[low]
+                sum_xx -= np.outer(centered[low], centered[low])
+                low += 1
+
+            if gaps_before[i] - gaps_before[window_low] > 0:
+                temp = self._turbulence_window(returns, i, time_period)
+                factor = None
+            else:
+                n_window = high - low
+                mean = sum_x / n_window
+                if factor is None or factor_age >= recompute_every:
+                    cov = (sum_xx - n_window * np.outer(mean, mean)) / (n_window - 1)
+                    try:
+                        factor = (True, np.linalg.cholesky(cov))
+                    except np.linalg.LinAlgError:
+                        factor = (False, np.linalg.pinv(cov))
+                    factor_age = 0
+                factor_age += 1
+
+                current_temp = returns[i] - shift - mean
+                is_cholesky, matrix = factor
+                if np.isnan(current_temp).any():
+                    temp = np.nan
+                elif is_cholesky:
+                    temp = np.sum(solve_triangular(matrix, current_temp, lower=True) ** 2)
+                else:
+                    temp = current_temp @ matrix @ current_temp
+
             if temp > 0:
                 count += 1
                 # avoid large outlier because of the calculation just begins: else turbulence_temp = 0
-                turbulence_temp = temp[0][0] if count > 2 else 0
-            else:
-                turbulence_temp = 0
-            turbulence_index.append(turbulence_temp)
+                turbulence_index[i] = temp if count > 2 else 0
 
         turbulence_index = pd.DataFrame(
             {"time": df_price_pivot.index, "turbulence": turbulence_index}
         )
         return turbulence_index
 
+    @staticmethod
+    def _turbulence_window(returns, i, time_period):
+        hist_price = returns[i - time_period:i]
+        # Drop tickers which has number missing values more than the "oldest" ticker
+        hist_price = hist_price[np.isnan(hist_price).sum(axis=0).min():]
+        columns = ~np.isnan(hist_price).any(axis=0)
+        hist_price = hist_price[:, columns]
+
+        cov_temp = np.atleast_2d(np.cov(hist_price, rowvar=False))
+        current_temp = returns[i, columns] - np.mean(hist_price, axis=0)
+        return current_temp @ np.linalg.pinv(cov_temp) @ current_temp
+
     def add_vix(self):
         """
         add vix from processors
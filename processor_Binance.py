@@ -7,8 +7,7 @@ utilizes the Client class from the binance library to interact with the Binance
 technical analysis on the data.
 
 The class has several methods, including __init__, run, download_data, clean_data, add_technical_indicator,
-drop_correlated_features, add_vix, df_to_array, servertime_to_datetime, get_binance_bars,
-and get_TALib_features_for_each_coin.
+drop_correlated_features, add_vix, df_to_array, servertime_to_datetime and get_binance_bars.
 
 __init__ is the constructor for the class. It sets several instance variables and assigns values to them.
 
@@ -17,31 +16,51 @@ technical_indicator_list, and if_vix. It sets the start_date and end_date to the
 other methods such as download_data, clean_data, add_technical_indicator, drop_correlated_features, add_vix,
 and df_to_array to process the data.
 
+update method takes the output of run (e.g. loaded from disk) and rolls it forward to a new start_date / end_date.
+Only candles newer than the last stored timestamp are downloaded, the indicators are recomputed over a warm-up tail of
+INDICATOR_WARMUP bars and the new rows are appended to the stored frame and arrays, drop_correlated_features is not run
+again (the stored columns are kept). The new rows are aligned on the stored coins and forward filled from the last
+stored row, OBV is re-based to the new start_date like a fresh download. When the stored data has other tickers,
+starts after the new start_date, ends before it or is not older than the new end_date, update falls back to a full
+run.
+
 download_data method takes in several parameters such as ticker_list, start_date, end_date, time_interval and calls
-get_binance_bars method to download the data from Binance and returns the final dataframe.
+download_klines method to download the data from Binance and returns the final dataframe. download_klines splits the
+date range into calendar months and fetches the months of all symbols in a thread pool (download_threads), every
+request passes a shared RateLimiter (requests_per_second). Complete months are stored in a local cache
+{cache_dir}/{symbol}/{interval}/{YYYY-MM}.npy, later runs only download the months that are missing. The exchange
+client can be injected with BinanceProcessor(client=...), any object with the get_klines() method of
+binance.client.Client works, e.g. a local fake.
 
 clean_data method takes in a dataframe and drops any NaN values from it.
 
 add_technical_indicator method takes in a dataframe and a list of technical indicators, and applies these indicators
-to the dataframe and returns the updated dataframe.
+to the dataframe and returns the updated dataframe. The rows are grouped per coin in one pass and the TA-Lib features
+are computed on contiguous NumPy blocks into one preallocated array, with BinanceProcessor(n_threads=...) > 1 the
+coins are computed in a thread pool.
 
 drop_correlated_features method drops features that are highly correlated with other features.
 
 add_vix method adds VIX data to the dataframe
 
-df_to_array method converts dataframe to array
+df_to_array method converts dataframe to array, pivoting the rows to time x coin. All coins are aligned on a master
+time index (the union of their timestamps), missing candles are forward filled with zero volume and
+self.valid_mask (time x coin) marks the rows that had a real candle
 
-servertime_to_datetime converts timestamp to datetime
+servertime_to_datetime converts ms timestamps to a UTC DatetimeIndex in one call, parse_klines casts the raw kline
+lists of the exchange to a float64 array in one call
 
 get_binance_bars method retrieves historical candlestick data from Binance.
 
-get_TALib_features_for_each_coin method is used to calculate technical indicators for each coin using TALib library.
-
 """
 
+import os
+import time
+import threading
 import pandas as pd
 from datetime import datetime
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from binance.client import Client
 from talib import RSI, MACD, CCI, DX, ROC, ULTOSC, WILLR, OBV, HT_DCPHASE
 
@@ -52,15 +71,46 @@ from fracdiff.sklearn import FracdiffStat
 
 binance_client = Client(api_key=API_KEY_BINANCE, api_secret=API_SECRET_BINANCE)
 
+TALIB_FEATURES = ['rsi', 'macd', 'cci', 'dx', 'roc', 'ultosc', 'willr', 'obv', 'ht_dcphase']
+KLINE_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+KLINE_LIMIT = 1000  # max. klines per request
+# Bars recomputed before the new candles on an update. The longest TA-Lib lookback is 63 (HT_DCPHASE, MACD 33), the
+# EMA / Wilder smoothed indicators need a longer tail to converge to the values of a full recompute
+INDICATOR_WARMUP = 1000
+
+
+class RateLimiter:
+    # Spaces the requests of all download threads at least 1 / requests_per_second apart
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
 class BinanceProcessor():
-    def __init__(self):
+    def __init__(self, n_threads=1, client=None, cache_dir='./data/klines_cache', download_threads=4,
+                 requests_per_second=10):
         self.end_date = None
         self.start_date = None
         self.tech_indicator_list = None
         self.correlation_threshold = 0.9
         self.binance_api_key = API_KEY_BINANCE  # Enter your own API-key here
         self.binance_api_secret = API_SECRET_BINANCE  # Enter your own API-secret here
-        self.binance_client = Client(api_key=API_KEY_BINANCE, api_secret=API_SECRET_BINANCE)
+        # Any object with the get_klines() method of binance.client.Client, e.g. a local fake
+        self.binance_client = client if client is not None else Client(api_key=API_KEY_BINANCE,
+                                                                      api_secret=API_SECRET_BINANCE)
+        self.n_threads = n_threads  # > 1 computes the TA-Lib features of the coins in a thread pool
+        self.cache_dir = cache_dir  # None disables the kline cache
+        self.download_threads = download_threads
+        self.rate_limiter = RateLimiter(requests_per_second)
 
     def run(self, ticker_list, start_date, end_date, time_interval, technical_indicator_list, if_vix):
         self.start_date = start_date
@@ -68,11 +118,7 @@ class BinanceProcessor():
         print('Downloading data from Binance...')
         data = self.download_data(ticker_list, start_date, end_date, time_interval)
         print('Downloading finished! Transforming data...')
-        data = self.clean_data(data)
-        data = data.drop(columns=['time'])
-        data['timestamp'] = self.servertime_to_datetime(data['timestamp'])
-        data = data.set_index('timestamp')
-        data = self.add_technical_indicator(data, technical_indicator_list)
+        data = self.transform_data(data, technical_indicator_list)
         data = self.drop_correlated_features(data)
 
         if if_vix:
@@ -87,6 +133,88 @@ class BinanceProcessor():
 
         return data, price_array, tech_array, time_array
 
+    def update(self, data, price_array, tech_array, time_array, ticker_list, start_date, end_date, time_interval,
+               technical_indicator_list, if_vix):
+        # Rolls the stored output of run() forward to [start_date, end_date], only the candles after the last stored
+        # timestamp are downloaded and the indicators are recomputed over a warm-up tail of INDICATOR_WARMUP bars.
+        # Equal to run(ticker_list, start_date, end_date, ...) in price_array, time_array, valid_mask, the candles and
+        # OBV. The other indicators of the first rows keep the history before start_date, where run() starts them
+        # cold, so they differ until the warm-up of run() has converged. drop_correlated_features is not run again.
+        # Falls back to run() when the stored data does not cover the start of the new window or the new window does
+        # not end after the stored one
+        self.start_date = start_date
+        self.end_date = end_date
+
+        # Stored datasets keep naive UTC times
+        data = data.set_axis(self._as_utc(data.index))
+        time_array = self._as_utc(time_array)
+        last_time = data.index.max()
+        last_ms = last_time.value // 10 ** 6
+        start_time = self.servertime_to_datetime([self.date_to_milliseconds(start_date)])[0]
+        end_ms = self.date_to_milliseconds(end_date)
+        if list(pd.unique(data['tic'])) != list(ticker_list):
+            print('Stored data has other tickers, downloading the full range...')
+            return self.run(ticker_list, start_date, end_date, time_interval, technical_indicator_list, if_vix)
+        if not data.index.min() <= start_time <= last_time or end_ms <= last_ms:
+            print('Stored data does not cover the start date or is not older than the end date, '
+                  'downloading the full range...')
+            return self.run(ticker_list, start_date, end_date, time_interval, technical_indicator_list, if_vix)
+        warmup_ms = last_ms - INDICATOR_WARMUP * int(pd.Timedelta(time_interval).total_seconds() * 1000)
+
+        print('Downloading new candles from Binance...')
+        tail = self.download_data(ticker_list, warmup_ms, end_date, time_interval)
+        tail = self.transform_data(tail, technical_indicator_list)
+        if if_vix:
+            tail = self.add_vix(tail)
+
+        # OBV is a running sum from the first bar, continue it from the stored value
+        if 'obv' in data.columns:
+            stored_obv = data.loc[data.index == last_time].set_index('tic')['obv']
+            tail_obv = tail.loc[tail.index == last_time].set_index('tic')['obv']
+            tail['obv'] += tail['tic'].map(stored_obv - tail_obv).to_numpy()
+
+        new_data = tail.loc[tail.index > last_time, data.columns]
+
+        # Drop the candles before the (moved) start date and append the new ones
+        keep = np.asarray(time_array >= start_time)
+        data = pd.concat([data.loc[data.index >= start_time], new_data])
+        data = data.iloc[self._group_by_tic(data)[0]]
+        if len(new_data):
+            # The new rows continue from the last stored row: same coins and columns, a coin without a new candle
+            # repeats its last stored candle instead of taking a later one
+            new_price_array, new_tech_array, new_time_array = self.df_to_array(
+                new_data, if_vix, tickers=ticker_list, last_row=(price_array[-1], tech_array[-1]))
+            new_tech_array[np.isnan(new_tech_array)] = 0
+            price_array = np.concatenate([price_array[keep], new_price_array])
+            tech_array = np.concatenate([tech_array[keep], new_tech_array])
+            time_array = time_array[keep].append(new_time_array)
+        else:
+            price_array, tech_array, time_array = price_array[keep], tech_array[keep], time_array[keep]
+
+        # TA-Lib starts OBV at the volume of the first candle, re-base it from the original download start to the
+        # first kept candle of every coin, in the frame and in the obv column of every coin in tech_array
+        if 'obv' in data.columns:
+            first = data.loc[~data['tic'].duplicated()].set_index('tic')
+            offset = first['obv'] - first['volume'] if 'volume' in data.columns else first['obv']
+            data['obv'] -= data['tic'].map(offset).to_numpy()
+            features = [column for column in data.columns if column != 'tic']
+            obv_columns = np.arange(len(ticker_list)) * len(features) + features.index('obv')
+            tech_array[:, obv_columns] -= offset.reindex(ticker_list).to_numpy()
+
+        # valid_mask of the whole window, the stored frame only holds real candles
+        valid_mask = np.zeros(price_array.shape, dtype=bool)
+        valid_mask[time_array.get_indexer(data.index), pd.Index(ticker_list).get_indexer(data['tic'])] = True
+        self.valid_mask = valid_mask
+        return data, price_array, tech_array, time_array
+
+    def transform_data(self, data, technical_indicator_list):
+        data = self.clean_data(data)
+        data = data.drop(columns=['time'])
+        data['timestamp'] = self.servertime_to_datetime(data['timestamp'])
+        data = data.set_index('timestamp')
+        data = self.add_technical_indicator(data, technical_indicator_list)
+        return data
+
     # main functions
     def download_data(self, ticker_list, start_date, end_date,
                       time_interval):
@@ -96,15 +224,109 @@ class BinanceProcessor():
         self.interval = time_interval
         self.ticker_list = ticker_list
 
-        final_df = pd.DataFrame()
+        klines = self.download_klines(ticker_list, self.interval, start_date, end_date)
+        frames = []
         for i in ticker_list:
-            hist_data = self.get_binance_bars(self.start_time, self.end_time, self.interval, symbol=i)
+            hist_data = self.klines_to_frame(klines[i])
             df = hist_data.iloc[:-1]
             df = df.dropna()
             df['tic'] = i
-            final_df = final_df.append(df)
+            frames.append(df)
+
+        return pd.concat(frames)
+
+    def download_klines(self, ticker_list, time_interval, start_date, end_date):
+        # Months of every symbol are fetched concurrently, past months are read from / written to the cache
+        start_ms, end_ms = self.date_to_milliseconds(start_date), self.date_to_milliseconds(end_date)
+        chunks = [(symbol, chunk_start, chunk_end)
+                  for symbol in ticker_list
+                  for chunk_start, chunk_end in self.month_chunks(start_ms, end_ms)]
+
+        with ThreadPoolExecutor(max_workers=max(self.download_threads, 1)) as executor:
+            chunk_klines = list(executor.map(lambda chunk: self.get_kline_chunk(chunk[0], time_interval, *chunk[1:]),
+                                             chunks))
+
+        klines = {}
+        for symbol in ticker_list:
+            symbol_klines = np.concatenate([values for (chunk_symbol, _, _), values in zip(chunks, chunk_klines)
+                                            if chunk_symbol == symbol] + [np.empty((0, len(KLINE_COLUMNS)))])
+            in_range = (symbol_klines[:, 0] >= start_ms) & (symbol_klines[:, 0] <= end_ms)
+            klines[symbol] = symbol_klines[in_range]
+        return klines
+
+    @staticmethod
+    def month_chunks(start_ms, end_ms):
+        # [start, end] in ms of every calendar month (UTC) touched by the range, end inclusive
+        if end_ms < start_ms:
+            return []
+        months = pd.date_range(pd.Timestamp(start_ms, unit='ms').to_period('M').start_time,
+                               pd.Timestamp(end_ms, unit='ms'), freq='MS')
+        bounds = [month.value // 10 ** 6 for month in months] + [(months[-1] + pd.offsets.MonthBegin()).value // 10 ** 6]
+        return [(chunk_start, chunk_end - 1) for chunk_start, chunk_end in zip(bounds[:-1], bounds[1:])]
+
+    def get_kline_chunk(self, symbol, time_interval, chunk_start, chunk_end):
+        # Only complete months are cached, the running month is always downloaded again
+        cacheable = self.cache_dir is not None and chunk_end < time.time() * 1000
+        if cacheable:
+            month = pd.Timestamp(chunk_start, unit='ms').strftime('%Y-%m')
+            file_path = os.path.join(self.cache_dir, symbol, time_interval, f'{month}.npy')
+            if os.path.exists(file_path):
+                return np.load(file_path)
+
+        values = self.fetch_klines(symbol, time_interval, chunk_start, chunk_end)
+
+        if cacheable:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            tmp_path = f'{file_path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as handle:
+                np.save(handle, values)
+            os.replace(tmp_path, file_path)
+        return values
+
+    def fetch_klines(self, symbol, time_interval, start_ms, end_ms):
+        # Paginated like get_historical_klines, every request goes through the shared rate limiter
+        rows = []
+        while start_ms <= end_ms:
+            self.rate_limiter.wait()
+            page = self.binance_client.get_klines(symbol=symbol, interval=time_interval, startTime=start_ms,
+                                                  endTime=end_ms, limit=KLINE_LIMIT)
+            if not page:
+                break
+            rows.extend(page)
+            start_ms = page[-1][0] + 1
+            if len(page) < KLINE_LIMIT:
+                break
+        return self.parse_klines(rows)
+
+    @staticmethod
+    def parse_klines(rows):
+        # Raw kline lists (numbers and numeric strings) to a (n, 6) float64 array of KLINE_COLUMNS in one cast,
+        # ms timestamps are exact in float64
+        if not rows:
+            return np.empty((0, len(KLINE_COLUMNS)))
+        return np.array(rows, dtype=object)[:, :len(KLINE_COLUMNS)].astype(np.float64)
+
+    @staticmethod
+    def klines_to_frame(values):
+        data_df = pd.DataFrame(values, columns=KLINE_COLUMNS)
+        data_df['timestamp'] = data_df['timestamp'].astype(np.int64)
+        data_df['time'] = pd.to_datetime(data_df['timestamp'].to_numpy(), unit='ms', utc=True)
+        return data_df
 
-        return final_df
+    @staticmethod
+    def _as_utc(times):
+        times = pd.DatetimeIndex(times)
+        return times.tz_localize('UTC') if times.tz is None else times.tz_convert('UTC')
+
+    @staticmethod
+    def date_to_milliseconds(date):
+        # Naive dates are UTC, like binance.helpers.date_to_milliseconds
+        if isinstance(date, (int, np.integer)):
+            return int(date)
+        timestamp = pd.Timestamp(date)
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.tz_localize('UTC')
+        return timestamp.value // 10 ** 6
 
     def frac_diff_features(self, array):
         print('Differentiating tech array...')
@@ -116,17 +338,43 @@ class BinanceProcessor():
         return df
 
     def add_technical_indicator(self, df, tech_indicator_list):
-        final_df = pd.DataFrame()
-        for i in df.tic.unique():
-            # use massive function in previous cell
-            coin_df = df[df.tic == i].copy()
-            coin_df = self.get_TALib_features_for_each_coin(coin_df)
-
-            # Append constructed tic_df
-            final_df = final_df.append(coin_df)
+        # One grouping pass, the rows of every coin become one contiguous block (coins in order of appearance)
+        order, starts, ends = self._group_by_tic(df)
+        coin_df = df.iloc[order]
+        ohlcv = {column: np.ascontiguousarray(coin_df[column].to_numpy(dtype=np.float64))
+                 for column in ['high', 'low', 'close', 'volume']}
+
+        features = np.empty((len(TALIB_FEATURES), len(coin_df)))
+
+        def compute_block(bounds):
+            start, end = bounds
+            block = {column: values[start:end] for column, values in ohlcv.items()}
+            self._talib_features(block['high'], block['low'], block['close'], block['volume'],
+                                 features[:, start:end])
+
+        blocks = list(zip(starts, ends))
+        if self.n_threads > 1:
+            # TA-Lib releases the GIL, the coins are computed concurrently
+            with ThreadPoolExecutor(max_workers=self.n_threads) as executor:
+                list(executor.map(compute_block, blocks))
+        else:
+            for bounds in blocks:
+                compute_block(bounds)
 
+        final_df = coin_df.copy()
+        for name, values in zip(TALIB_FEATURES, features):
+            final_df[name] = values
         return final_df
 
+    @staticmethod
+    def _group_by_tic(df):
+        # Stable sort on the factorized tickers, start/end row of each coin in the sorted order
+        codes, _ = pd.factorize(df['tic'])
+        order = np.argsort(codes, kind='stable')
+        ends = np.cumsum(np.bincount(codes))
+        starts = ends - np.bincount(codes)
+        return order, starts, ends
+
     def drop_correlated_features(self, df):
         corr_matrix = pd.DataFrame(df).corr().abs()
         upper_tri = corr_matrix.where(np.triu(np.ones(corr_matrix.shape), k=1).astype(np.bool))
@@ -156,23 +404,59 @@ class BinanceProcessor():
         df['CVIX'] = CVOL_df['close']
         return df
 
-    def df_to_array(self, df, if_vix):
+    def df_to_array(self, df, if_vix, tickers=None, last_row=None):
+        # tickers fixes the coin columns (default: order of appearance), last_row=(price_row, tech_row) is the row
+        # before df, e.g. the last stored row on an update, missing candles are then filled from it
         self.tech_indicator_list = list(df.columns)
         self.tech_indicator_list.remove('tic')
         print('adding technical indiciators (no:', len(self.tech_indicator_list), ') :', self.tech_indicator_list)
 
-        unique_ticker = df.tic.unique()
-        if_first_time = True
-        for tic in unique_ticker:
-            if if_first_time:
-                price_array = df[df.tic == tic][['close']].values
-                tech_array = df[df.tic == tic][self.tech_indicator_list].values
-                if_first_time = False
-            else:
-                price_array = np.hstack([price_array, df[df.tic == tic][['close']].values])
-                tech_array = np.hstack([tech_array, df[df.tic == tic][self.tech_indicator_list].values])
-
-            time_array = df[df.tic == self.ticker_list[0]].index
+        # Align all coins on one master time index (union of their timestamps) in one pass
+        if tickers is None:
+            codes, tickers = pd.factorize(df['tic'])
+        else:
+            tickers = pd.Index(tickers)
+            codes = tickers.get_indexer(df['tic'])
+        times = df.index.values
+        master_times = np.unique(times)
+        positions = np.searchsorted(master_times, times)
+        n_times, n_coins, n_features = len(master_times), len(tickers), len(self.tech_indicator_list)
+
+        values = np.full((n_times, n_coins, n_features + 1), np.nan)
+        values[positions, codes, 0] = df['close'].to_numpy(dtype=np.float64)
+        values[positions, codes, 1:] = df[self.tech_indicator_list].to_numpy(dtype=np.float64)
+        valid_mask = np.zeros((n_times, n_coins), dtype=bool)
+        valid_mask[positions, codes] = True
+        if last_row is not None:
+            price_row, tech_row = last_row
+            first_row = np.column_stack([price_row, np.reshape(tech_row, (n_coins, n_features))])
+            values = np.concatenate([first_row[None], values])
+            valid_mask = np.concatenate([np.ones((1, n_coins), dtype=bool), valid_mask])
+            n_times += 1
+
+        # Missing candles repeat the last candle of the coin (the first one before a coin starts), with zero volume
+        if not valid_mask.all():
+            last_valid = np.where(valid_mask, np.arange(n_times)[:, None], -1)
+            last_valid = np.maximum.accumulate(last_valid, axis=0)
+            last_valid = np.where(last_valid < 0, valid_mask.argmax(axis=0), last_valid)
+            values = values[last_valid, np.arange(n_coins)]
+            if 'volume' in self.tech_indicator_list:
+                values[:, :, 1 + self.tech_indicator_list.index('volume')][~valid_mask] = 0
+        if last_row is not None:
+            values, valid_mask = values[1:], valid_mask[1:]
+            n_times -= 1
+
+        price_array = np.ascontiguousarray(values[:, :, 0])
+        tech_array = np.ascontiguousarray(values[:, :, 1:]).reshape(n_times, n_coins * n_features)
+        time_array = pd.DatetimeIndex(master_times, name=df.index.name)
+        if getattr(df.index, 'tz', None) is not None:
+            time_array = time_array.tz_localize('UTC').tz_convert(df.index.tz)
+        # True where the coin had a candle at that time, False where the row was filled
+        self.valid_mask = valid_mask
+
+        missing = (~valid_mask).sum(axis=0)
+        if missing.any():
+            print('filled missing candles: ', dict(zip(tickers, missing.tolist())))
 
         assert price_array.shape[0] == tech_array.shape[0]
 
@@ -183,42 +467,23 @@ class BinanceProcessor():
         return str(int(date.timestamp() * 1000))
 
     def servertime_to_datetime(self, timestamp):
-        list_regular_stamps = [0] * len(timestamp)
-        for indx, ts in enumerate(timestamp):
-            list_regular_stamps[indx] = dt.datetime.fromtimestamp(ts / 1000)
-        return list_regular_stamps
+        # ms since epoch to a UTC DatetimeIndex
+        return pd.to_datetime(np.asarray(timestamp, dtype=np.int64), unit='ms', utc=True)
 
     def get_binance_bars(self, start_date, end_date, kline_size, symbol):
-        data_df = pd.DataFrame()
-        klines = self.binance_client.get_historical_klines(symbol, kline_size, start_date, end_date)
-        data = pd.DataFrame(klines,
-                            columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_av',
-                                     'trades', 'tb_base_av', 'tb_quote_av', 'ignore'])
-        data = data.drop(labels=['close_time', 'quote_av', 'trades', 'tb_base_av', 'tb_quote_av', 'ignore'], axis=1)
-        if len(data_df) > 0:
-            temp_df = pd.DataFrame(data)
-            data_df = data_df.append(temp_df)
-        else:
-            data_df = data
-
-        data_df = data_df.apply(pd.to_numeric, errors='coerce')
-        data_df['time'] = [datetime.fromtimestamp(x / 1000.0) for x in data_df.timestamp]
-        # data.drop(labels=["timestamp"], axis=1)
-        data_df.index = [x for x in range(len(data_df))]
-
-        return data_df
-
-    def get_TALib_features_for_each_coin(self, tic_df):
-
-        tic_df['rsi'] = RSI(tic_df['close'], timeperiod=14)
-        tic_df['macd'], _, _ = MACD(tic_df['close'], fastperiod=12,
-                                    slowperiod=26, signalperiod=9)
-        tic_df['cci'] = CCI(tic_df['high'], tic_df['low'], tic_df['close'], timeperiod=14)
-        tic_df['dx'] = DX(tic_df['high'], tic_df['low'], tic_df['close'], timeperiod=14)
-        tic_df['roc'] = ROC(tic_df['close'], timeperiod=10)
-        tic_df['ultosc'] = ULTOSC(tic_df['high'], tic_df['low'], tic_df['close'])
-        tic_df['willr'] = WILLR(tic_df['high'], tic_df['low'], tic_df['close'])
-        tic_df['obv'] = OBV(tic_df['close'], tic_df['volume'])
-        tic_df['ht_dcphase'] = HT_DCPHASE(tic_df['close'])
-
-        return tic_df
+        klines = self.download_klines([symbol], kline_size, start_date, end_date)
+        return self.klines_to_frame(klines[symbol])
+
+    @staticmethod
+    def _talib_features(high, low, close, volume, out):
+        # out: preallocated (len(TALIB_FEATURES), n) block, rows in the order of TALIB_FEATURES
+        out[0] = RSI(close, timeperiod=14)
+        out[1] = MACD(close, fastperiod=12, slowperiod=26, signalperiod=9)[0]
+        out[2] = CCI(high, low, close, timeperiod=14)
+        out[3] = DX(high, low, close, timeperiod=14)
+        out[4] = ROC(close, timeperiod=10)
+        out[5] = ULTOSC(high, low, close)
+        out[6] = WILLR(high, low, close)
+        out[7] = OBV(close, volume)
+        out[8] = HT_DCPHASE(close)
+        return out
@@ -15,7 +15,8 @@ download_data method takes in a list of ticker symbols and uses the yfinance lib
 ticker symbol, formats the data and returns it as a DataFrame.
 
 clean_data method takes the dataframe and cleans the data. It renames columns, gets the trading days,
-fills any missing data and sorts the dataframe by date and ticker.
+fills any missing data and sorts the dataframe by date and ticker. All tickers are reindexed at once onto the
+(tic, time) grid, missing rows repeat the previous close with zero volume.
 
 get_trading_days method takes in start and end date and returns the trading days between these dates.
 
@@ -107,63 +108,47 @@ class Yahoofinance(_Base):
         if time_interval == '1D':
             times = trading_days
         elif time_interval == '1Min':
-            times = []
-            for day in trading_days:
-                current_time = pd.Timestamp(day + ' 09:30:00').tz_localize(self.time_zone)
-                for _ in range(390):
-                    times.append(current_time)
-                    current_time += pd.Timedelta(minutes=1)
+            day_opens = pd.DatetimeIndex([day + ' 09:30:00' for day in trading_days]).tz_localize(self.time_zone)
+            minutes = pd.to_timedelta(np.tile(np.arange(390), len(trading_days)), unit='min')
+            times = list(day_opens.repeat(390) + minutes)
         else:
             raise ValueError('Data clean at given time interval is not supported for YahooFinance data.')
 
-        # fill NaN data
-        new_df = pd.DataFrame()
-        for tic in tic_list:
-            print(('Clean data for ') + tic)
-            # create empty DataFrame using complete time index
-            tmp_df = pd.DataFrame(columns=['open', 'high', 'low', 'close',
-                                           'adjusted_close', 'volume'],
-                                  index=times)
-            # get data for current ticker
-            tic_df = df[df.tic == tic]
-            # fill empty DataFrame using orginal data
-            for i in range(tic_df.shape[0]):
-                tmp_df.loc[tic_df.iloc[i]['time']] = tic_df.iloc[i] \
-                    [['open', 'high', 'low', 'close', 'adjusted_close', 'volume']]
-
-            # if close on start date is NaN, fill data with first valid close
-            # and set volume to 0.
-            if str(tmp_df.iloc[0]['close']) == 'nan':
-                print('NaN data on start date, fill using first valid data.')
-                for i in range(tmp_df.shape[0]):
-                    if str(tmp_df.iloc[i]['close']) != 'nan':
-                        first_valid_close = tmp_df.iloc[i]['close']
-                        first_valid_adjclose = tmp_df.iloc[i]['adjusted_close']
-
-                tmp_df.iloc[0] = [first_valid_close, first_valid_close,
-                                  first_valid_close, first_valid_close,
-                                  first_valid_adjclose, 0.0]
-
-            # fill NaN data with previous close and set volume to 0.
-            for i in range(tmp_df.shape[0]):
-                if str(tmp_df.iloc[i]['close']) == 'nan':
-                    previous_close = tmp_df.iloc[i - 1]['close']
-                    previous_adjusted_close = tmp_df.iloc[i - 1]['adjusted_close']
-                    if str(previous_close) == 'nan':
-                        raise ValueError
-                    tmp_df.iloc[i] = [previous_close, previous_close, previous_close,
-                                      previous_close, previous_adjusted_close, 0.0]
-
-            # merge single ticker data to new DataFrame
-            tmp_df = tmp_df.astype(float)
-            tmp_df['tic'] = tic
-            new_df = new_df.append(tmp_df)
-
-            print(('Data clean for ') + tic + (' is finished.'))
-
-        # reset index and rename columns
-        new_df = new_df.reset_index()
-        new_df = new_df.rename(columns={'index': 'time'})
+        # One (tic, time) grid for all tickers, matched on the normalized timestamps
+        columns = ['open', 'high', 'low', 'close', 'adjusted_close', 'volume']
+        grid_times = pd.DatetimeIndex(pd.to_datetime(times))
+        df_times = pd.DatetimeIndex(pd.to_datetime(df['time']))
+        if grid_times.tz is not None and df_times.tz is None:
+            df_times = df_times.tz_localize(grid_times.tz)
+        elif grid_times.tz is None and df_times.tz is not None:
+            df_times = df_times.tz_localize(None)
+        df = df.assign(time=df_times).drop_duplicates(subset=['tic', 'time'], keep='last')
+        full_index = pd.MultiIndex.from_product([tic_list, grid_times], names=['tic', 'time'])
+        new_df = df.set_index(['tic', 'time'])[columns].astype(float).reindex(full_index)
+
+        # Missing rows copy close and adjusted close of the previous valid row (of the first valid row before the first
+        # close of a ticker), open/high/low become that close and volume 0
+        n_tics, n_times = len(tic_list), len(grid_times)
+        valid = new_df['close'].notna().to_numpy().reshape(n_tics, n_times)
+        if not valid.any(axis=1).all():
+            raise ValueError('No valid close for ' + str(list(np.asarray(tic_list)[~valid.any(axis=1)])))
+        if not valid[:, 0].all():
+            print('NaN data on start date, fill using first valid data.')
+        source = np.where(valid, np.arange(n_times), -1)
+        source = np.maximum.accumulate(source, axis=1)
+        source = np.where(source < 0, valid.argmax(axis=1)[:, None], source)
+        source = (source + np.arange(n_tics)[:, None] * n_times).ravel()
+
+        values = new_df.to_numpy(copy=True)
+        missing = ~valid.ravel()
+        close, adjusted_close = values[source, 3], values[source, 4]
+        values[missing, :4] = close[missing, None]
+        values[missing, 4] = adjusted_close[missing]
+        values[missing, 5] = 0.0
+
+        new_df = pd.DataFrame(values, columns=columns)
+        new_df['tic'] = np.repeat(tic_list, n_times)
+        new_df.insert(0, 'time', list(times) * n_tics)
 
         print('Data clean all finished!')
 
@@ -0,0 +1,13 @@
+import numpy as np
+
+from function_CPCV import back_test_paths_generator
+
+
+def test_back_test_paths_with_remainder():
+    # 11 samples in 4 groups of 2, the 3 remaining samples belong to the last group
+    is_test, paths, path_folds = back_test_paths_generator(None, None, None, 11, 4, 2, None, None, verbose=False)
+    group_num = np.array([0, 0, 1, 1, 2, 2, 3, 3, 3, 3, 3])
+    assert is_test.shape == (11, 6)
+    np.testing.assert_array_equal(paths, path_folds[group_num])
+    # every sample is tested in the simulation its path takes it from
+    assert is_test[np.arange(11)[:, None], paths.astype(int)].all()
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from function_dataset import load_dataset, save_dataset, dataset_reference
+
+
+def _dataset():
+    index = pd.date_range('2022-01-01', periods=6, freq='5min', tz='UTC', name='time')
+    data_from_processor = pd.DataFrame({
+        'tic': ['BTCUSDT', 'ETHUSDT'] * 3,
+        'close': np.arange(6, dtype=np.float64),
+        'trades': np.arange(6, dtype=np.int64) * 2 ** 40,
+        'side': ['buy', 'sell', 'buy', 'buy', 'sell', 'buy'],
+        'volume': np.linspace(0, 1, 6),
+    }, index=index)
+    time_array = index[::2].tz_convert('Europe/Amsterdam')
+    price_array = np.arange(6, dtype=np.float64).reshape(3, 2)
+    tech_array = np.ones((3, 4))
+    return data_from_processor, price_array, tech_array, time_array
+
+
+def test_dataset_round_trip(tmp_path):
+    data_from_processor, price_array, tech_array, time_array = _dataset()
+    save_dataset(str(tmp_path), data_from_processor, price_array, tech_array, time_array)
+
+    loaded = load_dataset(str(tmp_path))
+    pd.testing.assert_frame_equal(loaded[0], data_from_processor, check_freq=False)
+    np.testing.assert_array_equal(loaded[1], price_array)
+    np.testing.assert_array_equal(loaded[2], tech_array)
+    pd.testing.assert_index_equal(loaded[3], time_array, exact=True)
+    assert loaded[3].tz == time_array.tz
+
+    assert isinstance(loaded[1], np.memmap)
+    assert len(dataset_reference(str(tmp_path))['hash']) == 64
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+import torch
+
+from config_main import ALPACA_LIMITS
+from environment_Alpaca import CryptoEnvAlpaca, CryptoVecEnvAlpaca
+
+ENV_PARAMS = {'lookback': 3, 'norm_cash': 2 ** -12, 'norm_stocks': 2 ** -8, 'norm_tech': 2 ** -15,
+              'norm_reward': 2 ** -10, 'norm_action': 100, 'env_num': 1}
+
+
+def _config(n_bars=60, n_coins=len(ALPACA_LIMITS), seed=2):
+    rng = np.random.default_rng(seed)
+    price_array = 10.0 ** rng.integers(-1, 4, n_coins) * np.exp(np.cumsum(rng.normal(0, 0.02, (n_bars, n_coins)),
+                                                                          axis=0))
+    tech_array = rng.normal(size=(n_bars, 3 * n_coins)) * 1e4
+    return {'price_array': price_array, 'tech_array': tech_array}
+
+
+def test_vec_env_matches_independent_envs():
+    env_num = 3
+    config = _config()
+    vec_env = CryptoVecEnvAlpaca(config, ENV_PARAMS, env_num=env_num, gpu_id=-1)
+    envs = [CryptoEnvAlpaca(config, ENV_PARAMS) for _ in range(env_num)]
+
+    rng = np.random.default_rng(5)
+    vec_state = vec_env.reset()
+    states = [env.reset() for env in envs]
+    np.testing.assert_allclose(vec_state.numpy(), np.stack(states), rtol=1e-6)
+
+    # two episodes, so the automatic reset after the last bar is stepped as well
+    n_done = 0
+    for _ in range(2 * vec_env.max_step + 1):
+        actions = rng.normal(0, 0.5, (env_num, vec_env.action_dim)).astype(np.float32)
+        vec_state, vec_reward, vec_dones, _ = vec_env.step(torch.as_tensor(actions))
+        assert vec_state.shape == (env_num, vec_env.state_dim) and vec_state.dtype == torch.float32
+        assert vec_reward.shape == (env_num,) and vec_reward.dtype == torch.float32
+        assert vec_dones.shape == (env_num,) and vec_dones.dtype == torch.bool
+
+        for i, env in enumerate(envs):
+            state, reward, done, _ = env.step(actions[i])
+            np.testing.assert_allclose(vec_reward[i].item(), reward, rtol=1e-4, atol=1e-6)
+            assert vec_dones[i].item() == done
+            if done:
+                state = env.reset()
+            np.testing.assert_allclose(vec_env.cash[i].item(), env.cash, rtol=1e-5)
+            # CryptoEnvAlpaca holds float32 stocks, so compare the holdings in cash against the portfolio value
+            price = env.price_array[env.time]
+            np.testing.assert_allclose(vec_env.stocks[i].numpy() * price, env.stocks * price, rtol=0,
+                                       atol=1e-6 * env.total_asset)
+            np.testing.assert_allclose(vec_state[i].numpy(), state, rtol=1e-5, atol=1e-7)
+        n_done += int(vec_dones.all())
+    assert n_done == 2
+
+
+def test_vec_env_rejects_other_coin_count():
+    with pytest.raises(ValueError, match='ALPACA_LIMITS'):
+        CryptoVecEnvAlpaca(_config(n_coins=len(ALPACA_LIMITS) - 1), ENV_PARAMS, gpu_id=-1)
+
+
+def _reference_state(env):
+    # The state of CryptoEnvAlpaca.get_state before the precomputed tech window
+    state = np.hstack((env.cash * env.norm_cash, env.stocks * env.norm_stocks))
+    for i in range(env.lookback):
+        tech_i = env.tech_array[env.time - i]
+        normalized_tech_i = tech_i * env.norm_tech
+        state = np.hstack((state, normalized_tech_i)).astype(np.float32)
+    return state
+
+
+def test_get_state_matches_lookback_window():
+    config = _config()
+    for lookback in [1, 3, 5]:
+        env = CryptoEnvAlpaca(config, dict(ENV_PARAMS, lookback=lookback))
+        vec_env = CryptoVecEnvAlpaca(config, dict(ENV_PARAMS, lookback=lookback), env_num=2, gpu_id=-1)
+        rng = np.random.default_rng(lookback)
+
+        state = env.reset()
+        vec_state = vec_env.reset()
+        assert env.time == lookback - 1
+        for _ in range(env.max_step - lookback + 1):
+            assert state.shape == (env.state_dim,) and state.dtype == np.float32
+            np.testing.assert_allclose(state, _reference_state(env), rtol=1e-6)
+            # the newest bar comes first, then the older bars of the lookback window
+            tech = state[1 + env.crypto_num:].reshape(lookback, -1)
+            np.testing.assert_allclose(tech[0], env.tech_array[env.time] * env.norm_tech, rtol=1e-6)
+            np.testing.assert_allclose(tech[-1], env.tech_array[env.time - lookback + 1] * env.norm_tech, rtol=1e-6)
+            for row in vec_state.numpy():
+                np.testing.assert_array_equal(row[1 + env.crypto_num:], state[1 + env.crypto_num:])
+
+            actions = rng.normal(0, 0.5, env.action_dim).astype(np.float32)
+            state, _, done, _ = env.step(actions)
+            vec_state, _, _, _ = vec_env.step(torch.as_tensor(np.stack([actions, actions])))
+        assert done and env.time == env.max_step
+        np.testing.assert_allclose(state, _reference_state(env), rtol=1e-6)
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+from function_finance_metrics import (drawdown, drawdown_ndarray, max_drawdown, max_drawdown_ndarray,
+                                      max_drawdown_single, sharpe_iid_rolling, sortino_iid_rolling, sortino_iid)
+
+
+def _equity_with_gaps():
+    rng = np.random.default_rng(3)
+    equity = np.exp(np.cumsum(rng.normal(0, 0.01, (500, 4)), axis=0))
+    equity[[0, 10, 11, 200], 1] = np.nan
+    equity[:5, 2] = np.nan
+    equity[50:70, 3] = np.nan
+    return equity
+
+
+def test_drawdown_skips_nan_like_pandas():
+    np.testing.assert_array_equal(drawdown(pd.Series([1, 2, np.nan, 1.5, 3])).values, [0, 0, np.nan, -0.25, 0])
+
+    equity = _equity_with_gaps()
+    frame = pd.DataFrame(equity)
+    expected = frame / frame.expanding().max() - 1
+    np.testing.assert_array_equal(drawdown_ndarray(equity), expected.values)
+    np.testing.assert_array_equal(max_drawdown_ndarray(equity), expected.min().values)
+    np.testing.assert_array_equal(max_drawdown(frame).values, expected.min().values)
+
+
+def test_max_drawdown_single_matches_pandas_rolling():
+    equity = _equity_with_gaps()
+    for column in range(equity.shape[1]):
+        series = pd.Series(equity[1:, column])
+        roll_max = series.rolling(10, min_periods=1).max()
+        expected = (series / roll_max - 1.0).rolling(10, min_periods=1).min()
+        np.testing.assert_array_equal(max_drawdown_single(equity[:, column], 10), expected.values)
+
+
+def test_rolling_sharpe_matches_pandas():
+    rng = np.random.default_rng(2)
+    returns = rng.normal(0.0003, 0.01, (1000, 5))
+    returns[5, 2] = np.nan
+    returns[100:104, 3] = np.nan
+    for window, min_periods in ((50, 50), (50, 10)):
+        excess = np.log1p(pd.DataFrame(returns))
+        rolling = excess.rolling(window, min_periods=min_periods)
+        expected = (rolling.mean() / rolling.std(ddof=1)).values
+        result = sharpe_iid_rolling(np.log1p(returns), window, min_periods)
+        np.testing.assert_array_equal(np.isnan(result), np.isnan(expected))
+        np.testing.assert_allclose(result, expected, rtol=0, atol=1e-12)
+
+
+def test_rolling_sortino_matches_sortino_iid():
+    returns = np.random.default_rng(4).normal(0.0003, 0.01, 600)
+    result = sortino_iid_rolling(returns, 200, 200)
+    for end in (200, 450, 600):
+        assert np.isclose(result[end - 1], sortino_iid(returns[end - 200:end]).values[0], rtol=0, atol=1e-12)
+
+
+def test_metrics_accumulator_drawdown_starts_at_first_bar():
+    from function_finance_metrics import MetricsAccumulator, max_drawdown_from_rtns
+
+    returns = np.array([-0.05, 0.01, 0.02, -0.01, 0.03])
+    expected = max_drawdown_from_rtns(pd.Series(returns), log=False)
+    # pct returns go through pct_to_log_return, which adds 1e-8 per bar
+    assert np.isclose(MetricsAccumulator.from_returns(returns, log=False).max_drawdown, expected, rtol=0, atol=1e-7)
+
+    # merged chunks, also when the first chunk starts with a loss
+    rng = np.random.default_rng(5)
+    returns = np.r_[-0.03, rng.normal(0, 0.01, 999)]
+    accumulator = MetricsAccumulator()
+    for chunk in np.array_split(returns, 7):
+        accumulator.merge(MetricsAccumulator.from_returns(chunk))
+    single = MetricsAccumulator.from_returns(returns)
+    expected = max_drawdown_from_rtns(pd.Series(returns))
+    assert np.isclose(accumulator.max_drawdown, expected, rtol=0, atol=1e-12)
+    assert np.isclose(single.max_drawdown, expected, rtol=0, atol=1e-12)
+    assert np.isclose(accumulator.sharpe, single.sharpe, rtol=1e-12)
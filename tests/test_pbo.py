@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+from function_PBO import sharpe_statistics
+from function_finance_metrics import sharpe_iid, pct_to_log_excess
+
+
+def test_sharpe_statistics_moments_of_raw_returns():
+    rng = np.random.default_rng(0)
+    M = rng.standard_t(4, (3000, 6)) * 0.02 + 0.001
+    M[5:9, 2] = np.nan
+    frame = pd.DataFrame(M)
+
+    for log in [True, False]:
+        stats = sharpe_statistics(M, log=log, chunk_size=700)
+        # skew and kurtosis of the returns as given, like psr_from_returns and sharpe_iid_adjusted
+        np.testing.assert_allclose(stats.skew, frame.skew().values, rtol=1e-12)
+        np.testing.assert_allclose(stats.kurtosis, frame.kurtosis().values + 3, rtol=1e-12)
+        # the Sharpe ratio of the log excess returns, like sharpe_iid
+        full = [0, 1, 3, 4, 5]
+        np.testing.assert_allclose(stats.sharpe[full], sharpe_iid(M[:, full], factor=1, log=log)[0], rtol=1e-12)
+
+    # for pct returns the log excess returns have another skew
+    log_skew = pd.DataFrame(pct_to_log_excess(M, 0)).skew().values
+    assert not np.allclose(sharpe_statistics(M, log=False).skew, log_skew)
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('talib')
+pytest.importorskip('binance')
+pytest.importorskip('fracdiff')
+
+from processor_Binance import BinanceProcessor, INDICATOR_WARMUP
+
+TICKERS = ['AAACOIN', 'BBBCOIN']
+INDICATORS = ['open', 'high', 'low', 'close', 'volume', 'rsi', 'macd', 'cci', 'dx', 'roc', 'ultosc', 'willr', 'obv',
+              'ht_dcphase']
+STEP_MS = 5 * 60 * 1000
+START_MS = 1640995200000  # 2022-01-01
+N_CANDLES = 4000
+
+
+class FakeClient:
+    """get_klines() of binance.client.Client over a fixed random walk, BBBCOIN misses some candles."""
+
+    def __init__(self):
+        rng = np.random.default_rng(0)
+        self.prices = {tic: 100 * np.exp(np.cumsum(rng.normal(0, 0.003, N_CANDLES))) for tic in TICKERS}
+        self.volumes = {tic: rng.uniform(500, 1500, N_CANDLES).round(1) for tic in TICKERS}
+        self.missing = {'AAACOIN': set(), 'BBBCOIN': {1500, 3400, 3401}}
+
+    def get_klines(self, symbol, interval, startTime, endTime, limit):
+        rows = []
+        i = max(0, -(-(startTime - START_MS) // STEP_MS))
+        while len(rows) < limit and i < N_CANDLES and START_MS + i * STEP_MS <= endTime:
+            if i not in self.missing[symbol]:
+                price = self.prices[symbol][i]
+                rows.append([START_MS + i * STEP_MS, f'{price:.6f}', f'{price * 1.001:.6f}', f'{price * 0.999:.6f}',
+                             f'{price:.6f}', f'{self.volumes[symbol][i]:.1f}'])
+            i += 1
+        return rows
+
+
+def _date(candle):
+    return str(pd.Timestamp(START_MS + candle * STEP_MS, unit='ms'))
+
+
+def _processor():
+    return BinanceProcessor(client=FakeClient(), cache_dir=None, requests_per_second=1000)
+
+
+def test_update_matches_run(monkeypatch):
+    # drop_correlated_features uses np.bool and corr() over the tic column, which fail on current NumPy / pandas
+    monkeypatch.setattr(BinanceProcessor, 'drop_correlated_features', lambda self, df: df)
+
+    stored = _processor().run(TICKERS, _date(0), _date(3000), '5m', INDICATORS, if_vix=False)
+    updater = _processor()
+    updated = updater.update(*stored, TICKERS, _date(500), _date(3800), '5m', INDICATORS, if_vix=False)
+    runner = _processor()
+    expected = runner.run(TICKERS, _date(500), _date(3800), '5m', INDICATORS, if_vix=False)
+
+    data, price_array, tech_array, time_array = updated
+    expected_data, expected_price_array, expected_tech_array, expected_time_array = expected
+    np.testing.assert_array_equal(price_array, expected_price_array)
+    pd.testing.assert_index_equal(time_array, expected_time_array)
+    np.testing.assert_array_equal(updater.valid_mask, runner.valid_mask)
+
+    # the candles and OBV everywhere, the other indicators once the warm-up of run() has converged
+    columns = ['open', 'high', 'low', 'close', 'volume', 'obv']
+    pd.testing.assert_frame_equal(data[columns + ['tic']], expected_data[columns + ['tic']], check_freq=False)
+    features = [column for column in expected_data.columns if column != 'tic']
+    n_features = len(features)
+    for j, feature in enumerate(features):
+        rows = slice(None) if feature in columns else slice(INDICATOR_WARMUP, None)
+        np.testing.assert_allclose(tech_array[rows, j::n_features], expected_tech_array[rows, j::n_features],
+                                   rtol=1e-9, atol=1e-9, err_msg=feature)
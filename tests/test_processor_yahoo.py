@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+Yahoofinance = pytest.importorskip('processor_Yahoo').Yahoofinance
+
+COLUMNS = ['open', 'high', 'low', 'close', 'adjusted_close', 'volume']
+
+
+def _reference_clean_data(df, times):
+    # The per-ticker loop of Yahoofinance.clean_data before the MultiIndex reindex (append -> concat)
+    new_df = []
+    for tic in np.unique(df.tic.values):
+        tmp_df = pd.DataFrame(columns=COLUMNS, index=times)
+        tic_df = df[df.tic == tic]
+        for i in range(tic_df.shape[0]):
+            tmp_df.loc[tic_df.iloc[i]['time']] = tic_df.iloc[i][COLUMNS]
+
+        if str(tmp_df.iloc[0]['close']) == 'nan':
+            for i in range(tmp_df.shape[0]):
+                if str(tmp_df.iloc[i]['close']) != 'nan':
+                    first_valid_close = tmp_df.iloc[i]['close']
+                    first_valid_adjclose = tmp_df.iloc[i]['adjusted_close']
+            tmp_df.iloc[0] = [first_valid_close, first_valid_close, first_valid_close, first_valid_close,
+                              first_valid_adjclose, 0.0]
+
+        for i in range(tmp_df.shape[0]):
+            if str(tmp_df.iloc[i]['close']) == 'nan':
+                previous_close = tmp_df.iloc[i - 1]['close']
+                previous_adjusted_close = tmp_df.iloc[i - 1]['adjusted_close']
+                tmp_df.iloc[i] = [previous_close, previous_close, previous_close, previous_close,
+                                  previous_adjusted_close, 0.0]
+
+        tmp_df = tmp_df.astype(float)
+        tmp_df['tic'] = tic
+        new_df.append(tmp_df)
+    return pd.concat(new_df).reset_index().rename(columns={'index': 'time'})
+
+
+def test_clean_data_matches_reference_loop(monkeypatch):
+    rng = np.random.default_rng(3)
+    times = [str(day)[:10] for day in pd.bdate_range('2022-01-03', periods=40)]
+    # uneven interior gaps, a ticker that starts late and a ticker without gaps
+    missing = {'AAA': [5, 6, 7, 20, 39], 'BBB': [0, 1, 2, 3, 11, 12, 30], 'CCC': []}
+    frames = []
+    for tic, gaps in missing.items():
+        keep = np.setdiff1d(np.arange(len(times)), gaps)
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(keep))))
+        frames.append(pd.DataFrame({'date': np.asarray(times)[keep], 'open': close * 1.01, 'high': close * 1.02,
+                                    'low': close * 0.98, 'close': close, 'adjusted_close': close * 0.9,
+                                    'volume': rng.uniform(1e3, 1e4, len(keep)), 'tic': tic}))
+    dataframe = pd.concat(frames).sample(frac=1, random_state=0).reset_index(drop=True)
+
+    processor = Yahoofinance('yahoofinance', times[0], times[-1], '1D')
+    processor.dataframe = dataframe
+    monkeypatch.setattr(processor, 'get_trading_days', lambda start, end: times)
+    processor.clean_data()
+    cleaned = processor.dataframe
+
+    expected = _reference_clean_data(dataframe.rename(columns={'date': 'time'}), times)
+    assert list(cleaned.columns) == ['time'] + COLUMNS + ['tic']
+    assert list(cleaned['time']) == list(expected['time'])
+    assert list(cleaned['tic']) == list(expected['tic'])
+
+    # the loop filled a leading gap from the last valid close of the ticker (it never breaks), so compare from the
+    # first valid row of each ticker onwards
+    leading = (cleaned['tic'] == 'BBB') & (cleaned['time'] < times[4])
+    pd.testing.assert_frame_equal(cleaned.loc[~leading, COLUMNS], expected.loc[~leading, COLUMNS])
+
+    # a leading gap copies the first valid close and adjusted close, with volume 0
+    first_valid = dataframe[(dataframe['tic'] == 'BBB') & (dataframe['date'] == times[4])].iloc[0]
+    assert leading.sum() == 4
+    np.testing.assert_array_equal(cleaned.loc[leading, ['open', 'high', 'low', 'close']], first_valid['close'])
+    np.testing.assert_array_equal(cleaned.loc[leading, 'adjusted_close'], first_valid['adjusted_close'])
+    np.testing.assert_array_equal(cleaned.loc[leading, 'volume'], 0.0)
@@ -0,0 +1,154 @@
+import numpy as np
+import torch
+
+from function_trading import trade_step
+
+BUY_COST_PCT = 0.003
+SELL_COST_PCT = 0.003
+SAFETY_FACTOR_STOCK_BUY = 0.9
+
+
+def _reference_trade_step(actions, price, stocks, stocks_cooldown, cash, minimum_qty):
+    # The per-coin loop of CryptoEnvAlpaca.step before trade_step
+    for i in range(len(actions)):
+        if stocks[i] > 0:
+            stocks_cooldown[i] += 1
+
+    for index in np.where(actions < -minimum_qty)[0]:
+        if stocks[index] > 0:
+            if price[index] > 0:
+                sell_num_shares = min(stocks[index], -actions[index])
+                stocks_cooldown[index] = 0
+                stocks[index] -= sell_num_shares
+                cash += price[index] * sell_num_shares * (1 - SELL_COST_PCT)
+
+    for index in np.where(stocks_cooldown >= 48)[0]:
+        sell_num_shares = stocks[index] * 0.05
+        stocks_cooldown[index] = 0
+        stocks[index] -= sell_num_shares
+        cash += price[index] * sell_num_shares * (1 - SELL_COST_PCT)
+
+    for index in np.where(actions > minimum_qty)[0]:
+        if price[index] > 0:
+            fee_corrected_asset = cash / (1 + BUY_COST_PCT)
+            max_stocks_can_buy = (fee_corrected_asset / price[index]) * SAFETY_FACTOR_STOCK_BUY
+            buy_num_shares = min(max_stocks_can_buy, actions[index])
+            if buy_num_shares < minimum_qty[index]:
+                buy_num_shares = 0
+            stocks[index] += buy_num_shares
+            cash -= price[index] * buy_num_shares * (1 + BUY_COST_PCT)
+    return cash
+
+
+def _random_portfolios(rng, n_portfolios, n_coins):
+    price = rng.uniform(1, 100, n_coins)
+    price[0] = 0  # missing data
+    minimum_qty = rng.uniform(0.01, 0.1, n_coins)
+    stocks = np.where(rng.random((n_portfolios, n_coins)) < 0.6, rng.uniform(0, 5, (n_portfolios, n_coins)), 0)
+    stocks_cooldown = rng.integers(0, 49, (n_portfolios, n_coins)).astype(np.float64)
+    stocks_cooldown[:, 1] = 47  # forced sell on this bar when held
+    cash = rng.uniform(0, 500, n_portfolios)
+    cash[0] = 1.0  # buys below the minimum quantity
+    actions = rng.normal(0, 3, (n_portfolios, n_coins))
+    # orders right at the minimum quantity
+    actions[:, 2] = minimum_qty[2] * rng.choice([-1, 1], n_portfolios)
+    return actions, price, stocks, stocks_cooldown, cash, minimum_qty
+
+
+def test_trade_step_matches_reference_loop():
+    rng = np.random.default_rng(7)
+    for _ in range(50):
+        actions, price, stocks, stocks_cooldown, cash, minimum_qty = _random_portfolios(rng, 8, 6)
+        expected_stocks, expected_cooldown = stocks.copy(), stocks_cooldown.copy()
+        expected_cash = np.array([_reference_trade_step(actions[i], price, expected_stocks[i], expected_cooldown[i],
+                                                        cash[i], minimum_qty)
+                                  for i in range(len(cash))])
+
+        # one portfolio at a time and all portfolios as a batch
+        for i in range(len(cash)):
+            single_stocks, single_cooldown = stocks[i].copy(), stocks_cooldown[i].copy()
+            single_cash = trade_step(actions[i], price, single_stocks, single_cooldown, cash[i], minimum_qty)
+            np.testing.assert_allclose(single_stocks, expected_stocks[i], rtol=1e-12)
+            np.testing.assert_array_equal(single_cooldown, expected_cooldown[i])
+            np.testing.assert_allclose(single_cash, expected_cash[i], rtol=1e-12)
+
+        batch_stocks, batch_cooldown = stocks.copy(), stocks_cooldown.copy()
+        batch_cash = trade_step(actions, price, batch_stocks, batch_cooldown, cash, minimum_qty)
+        np.testing.assert_allclose(batch_stocks, expected_stocks, rtol=1e-12)
+        np.testing.assert_array_equal(batch_cooldown, expected_cooldown)
+        np.testing.assert_allclose(batch_cash, expected_cash, rtol=1e-12)
+
+        # the vectorized environment runs the same kernel on torch tensors
+        torch_stocks, torch_cooldown = torch.from_numpy(stocks.copy()), torch.from_numpy(stocks_cooldown.copy())
+        torch_cash = trade_step(torch.from_numpy(actions), torch.from_numpy(price), torch_stocks, torch_cooldown,
+                                torch.from_numpy(cash), torch.from_numpy(minimum_qty))
+        np.testing.assert_allclose(torch_stocks.numpy(), expected_stocks, rtol=1e-12)
+        np.testing.assert_array_equal(torch_cooldown.numpy(), expected_cooldown)
+        np.testing.assert_allclose(torch_cash.numpy(), expected_cash, rtol=1e-12)
+
+
+def test_trade_step_edge_cases():
+    minimum_qty = np.array([0.1, 0.1, 0.1])
+    price = np.array([0.0, 10.0, 20.0])
+
+    # no sell at a zero price, but the forced sell of a held coin still happens
+    stocks = np.array([1.0, 1.0, 0.0])
+    stocks_cooldown = np.array([47.0, 47.0, 0.0])
+    cash = trade_step(np.array([-1.0, 0.0, 0.0]), price, stocks, stocks_cooldown, 0.0, minimum_qty)
+    np.testing.assert_allclose(stocks, [0.95, 0.95, 0.0])
+    np.testing.assert_array_equal(stocks_cooldown, [0, 0, 0])
+    np.testing.assert_allclose(cash, 10 * 0.05 * (1 - SELL_COST_PCT))
+
+    # a buy that the cash limits below the minimum quantity is dropped
+    stocks = np.zeros(3)
+    cash = trade_step(np.array([0.0, 0.0, 1.0]), price, stocks, np.zeros(3), 1.0, minimum_qty)
+    np.testing.assert_array_equal(stocks, 0)
+    assert cash == 1.0
+
+
+def _alpaca_env(lookback=3, n_bars=300, seed=2):
+    from config_main import ALPACA_LIMITS
+    from environment_Alpaca import CryptoEnvAlpaca
+
+    rng = np.random.default_rng(seed)
+    n_coins = len(ALPACA_LIMITS)
+    price_array = 10.0 ** rng.integers(-1, 4, n_coins) * np.exp(np.cumsum(rng.normal(0, 0.02, (n_bars, n_coins)),
+                                                                          axis=0))
+    tech_array = rng.normal(size=(n_bars, 3 * n_coins)) * 1e4
+    env_params = {'lookback': lookback, 'norm_cash': 2 ** -12, 'norm_stocks': 2 ** -8, 'norm_tech': 2 ** -15,
+                  'norm_reward': 2 ** -10, 'norm_action': 100, 'env_num': 1}
+    return CryptoEnvAlpaca({'price_array': price_array, 'tech_array': tech_array}, env_params)
+
+
+def _rollout_total_assets(act, environment):
+    # The bar by bar loop of DRLAgent.DRL_prediction before backtest_actor
+    state = environment.reset()
+    episode_total_assets = [environment.initial_total_asset]
+    with torch.no_grad():
+        for _ in range(environment.max_step):
+            action = act(torch.as_tensor(state[None])).cpu().numpy()[0]
+            state, reward, done, _ = environment.step(action)
+            episode_total_assets.append(environment.cash +
+                                        (environment.price_array[environment.time] * environment.stocks).sum())
+            if done:
+                break
+    return episode_total_assets
+
+
+def test_backtest_actor_matches_env_rollout():
+    from drl_agents.agents.net import Actor, ActorPPO, ActorSAC
+    from function_trading import backtest_actor
+
+    torch.manual_seed(0)
+    environment = _alpaca_env()
+    for actor_class in [ActorPPO, Actor, ActorSAC]:
+        act = actor_class(32, environment.state_dim, environment.action_dim)
+        first_layer = (act.net if hasattr(act, 'net') else act.net_state)[0]
+        expected = _rollout_total_assets(act, _alpaca_env())
+        total_assets = backtest_actor(act, _alpaca_env(), torch.device('cpu'))
+
+        assert len(total_assets) == len(expected)
+        assert np.ptp(expected) > 0  # the actor trades
+        np.testing.assert_allclose(total_assets, expected, rtol=1e-6, err_msg=actor_class.__name__)
+        # the projected first layer replaces the layer of a copy, not of the actor itself
+        assert (act.net if hasattr(act, 'net') else act.net_state)[0] is first_layer